@@ -0,0 +1,335 @@
+import argparse
+import json
+import os
+import pickle
+import random
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import telebot
+from telebot import apihelper, types
+
+# Офлайн-бенчмарк: синтетичні користувачі, фейковий транспорт Telegram і сценарії розмов,
+# що проходять через справжні обробники. Набір даних створюється в тимчасовому каталозі,
+# який видаляється після запуску. Запуск: python benchmarks/benchmark.py [--save]
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+SLIM_TRACKER_DIR = os.path.join(os.path.dirname(BENCHMARK_DIR), 'slim_tracker')
+BASELINE_FILE = os.path.join(BENCHMARK_DIR, "benchmark_baseline.json")
+# Допустиме погіршення відносно збереженої бази, частка
+TOLERANCE = 0.25
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк обробників бота на синтетичних даних")
+    parser.add_argument('--users', type=int, default=10000, help="кількість користувачів у наборі даних")
+    parser.add_argument('--days', type=int, default=365, help="кількість днів щоденних замірів кожного користувача")
+    parser.add_argument('--sessions', type=int, default=1000, help="кількість сценаріїв розмов на кожну фазу")
+    parser.add_argument('--backend', choices=('pickle', 'sqlite'), default='pickle')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save', action='store_true', help="зберегти результати як нову базу")
+    return parser.parse_args(argv)
+
+
+# Фейковий транспорт: відповідає на запити Bot API без мережі
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, result):
+        self.result = result
+
+    def json(self):
+        return {'ok': True, 'result': self.result}
+
+    @property
+    def text(self):
+        return json.dumps(self.json())
+
+
+class FakeTransport:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, method, url, params=None, **kwargs):
+        self.calls += 1
+        params = params or {}
+        name = url.rsplit('/', 1)[-1]
+        if name == 'getFile':
+            return FakeResponse({'file_id': params['file_id'], 'file_unique_id': params['file_id'],
+                                 'file_path': 'voice/file.oga'})
+        chat_id = int(params.get('chat_id', 0))
+        return FakeResponse({'message_id': self.calls, 'date': 0, 'chat': {'id': chat_id, 'type': 'private'}})
+
+
+# Голосове повідомлення: секунда тиші в OGG/Opus, якщо доступний ffmpeg
+def make_voice():
+    if not shutil.which('ffmpeg'):
+        return b''
+    import io
+    from pydub import AudioSegment
+    buffer = io.BytesIO()
+    AudioSegment.silent(duration=1000, frame_rate=16000).export(buffer, format='ogg', codec='libopus')
+    return buffer.getvalue()
+
+
+# Синтетичні дані: щоденні заміри за останні days днів (без сьогоднішнього) з випадковим блуканням ваги
+def generate_dataset(users, days, seed):
+    from models import kiev_timezone
+    rng = np.random.default_rng(seed)
+    today = datetime.now(kiev_timezone).date()
+    first_day = (today - timedelta(days=days)).toordinal()
+    day_numbers = np.arange(first_day, first_day + days, dtype=np.int32)
+    for user_id in range(1, users + 1):
+        start = rng.uniform(60, 120)
+        weights = np.round(start + np.cumsum(rng.normal(-0.02, 0.3, days)), 1).astype(np.float32)
+        height = float(round(rng.uniform(150, 200)))
+        yield user_id, ('👨' if user_id % 2 else '👩'), f"User{user_id}", 30, height, day_numbers, weights
+
+
+def write_pickle(dataset):
+    from models import UserInfo
+    from storage import DATA_FILE
+    users = {}
+    for user_id, gender, first_name, age, height, days, weights in dataset:
+        user_info = UserInfo(gender=gender, first_name=first_name, age=age, height=height, weight=float(weights[-1]))
+        series = user_info.measurements
+        series.days.frombytes(days.tobytes())
+        series.weights.frombytes(weights.tobytes())
+        series.ages.extend([age] * len(days))
+        series.heights.extend([height] * len(days))
+        users[user_id] = user_info
+    with open(DATA_FILE, 'wb') as file:
+        pickle.dump(users, file)
+
+
+def write_sqlite(dataset):
+    from storage import SQLiteStorage, DB_FILE
+    SQLiteStorage(DB_FILE, 1).close()
+    conn = sqlite3.connect(DB_FILE)
+    with conn:
+        for user_id, gender, first_name, age, height, days, weights in dataset:
+            conn.execute("INSERT INTO users VALUES (?, ?, ?, ?, ?, ?)",
+                         (user_id, gender, first_name, age, height, float(weights[-1])))
+            conn.executemany("INSERT INTO measurements VALUES (?, ?, ?, ?, ?)",
+                             ((user_id, int(day), age, height, float(weight)) for day, weight in zip(days, weights)))
+    conn.close()
+
+
+# Старт бота в окремому процесі: від запуску інтерпретатора до завантажених даних
+STARTUP_SCRIPT = '''
+import sys, time
+started = time.perf_counter()
+sys.path.insert(0, {path!r})
+import main
+imported = time.perf_counter()
+main.load_data()
+print(imported - started, 'pydub' in sys.modules or 'speech_recognition' in sys.modules)
+'''
+
+
+def measure_startup():
+    script = STARTUP_SCRIPT.format(path=SLIM_TRACKER_DIR)
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout
+    elapsed = time.perf_counter() - started
+    import_time, audio_imported = output.split()
+    return elapsed, float(import_time), audio_imported == 'True'
+
+
+def make_update(update_id, user_id, text=None, voice=False):
+    message = {'message_id': update_id, 'date': 0,
+               'chat': {'id': user_id, 'type': 'private'},
+               'from': {'id': user_id, 'is_bot': False, 'first_name': f"User{user_id}"}}
+    if voice:
+        message['voice'] = {'file_id': f"voice{update_id}", 'file_unique_id': f"voice{update_id}", 'duration': 1}
+    else:
+        message['text'] = text
+    return types.Update.de_json({'update_id': update_id, 'message': message})
+
+
+# Сценарії розмов: (назва кроку, текст або None для голосового повідомлення)
+REGISTRATION = [('start', '/start'), ('registration', '👨'), ('registration', '30'),
+                ('registration', '180'), ('registration', '85')]
+ACTIVE_USER = [('measurement', 'Внести заміри 📏'), ('measurement', 'Далі'), ('measurement', 'Далі'),
+               ('measurement', '84.5'), ('profile', 'Мій профіль 👤'), ('top', 'Найкращі результати 🏆'),
+               ('voice', None)]
+
+
+# Сценарії для фази: кожен десятий - реєстрація нового користувача
+def build_sessions(rng, count, users, new_user_ids):
+    sessions = []
+    for _ in range(count):
+        if rng.random() < 0.1:
+            sessions.append((next(new_user_ids), REGISTRATION))
+        else:
+            sessions.append((rng.randint(1, users), ACTIVE_USER))
+    return sessions
+
+
+def build_updates(sessions, update_ids):
+    return [(label, make_update(next(update_ids), user_id, text, voice=text is None))
+            for user_id, script in sessions for label, text in script]
+
+
+def percentile(samples, q):
+    return float(np.percentile(samples, q) * 1000) if samples else None
+
+
+def rss_mb():
+    with open('/proc/self/statm') as file:
+        return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+
+def run(args):
+    import outbox as outbox_module
+    # Вимірюємо самого бота, а не ліміти Telegram
+    outbox_module.GLOBAL_RATE = outbox_module.CHAT_RATE = outbox_module.CHAT_BURST = 10 ** 9
+    transport = FakeTransport()
+    apihelper.CUSTOM_REQUEST_SENDER = transport
+    voice_bytes = make_voice()
+    apihelper.download_file = lambda token, file_path: voice_bytes
+    from models import kiev_timezone
+    import service
+    import speech
+
+    rng = random.Random(args.seed)
+    results = {'config': {'users': args.users, 'days': args.days, 'sessions': args.sessions,
+                          'backend': args.backend, 'voice_decoding': bool(voice_bytes)}}
+
+    started = time.perf_counter()
+    dataset = generate_dataset(args.users, args.days, args.seed)
+    if args.backend == 'sqlite':
+        write_sqlite(dataset)
+    else:
+        write_pickle(dataset)
+    results['generate_s'] = time.perf_counter() - started
+    results['startup_s'], results['import_main_s'], results['audio_stack_at_startup'] = measure_startup()
+
+    import main
+
+    started = time.perf_counter()
+    service.load_data()
+    results['load_data_s'] = time.perf_counter() - started
+    results['rss_after_load_mb'] = rss_mb()
+
+    # Розпізнавач-заглушка; без ffmpeg заглушкою стає і декодування
+    class StubRecognizer:
+        def recognize(self, audio_data, timeout=None):
+            return "Привіт"
+
+    speech.init_speech(backends=())
+    speech.recognizers = [('stub', StubRecognizer())]
+    if not voice_bytes:
+        speech.decode_voice = lambda data, sample_rate=speech.SAMPLE_RATE: None
+
+    new_user_ids = iter(range(args.users + 1, args.users + 10 ** 9))
+    update_ids = iter(range(1, 10 ** 9))
+
+    # Затримка: кожне оновлення обробляється послідовно, повним шляхом фільтрів і обробників
+    latencies = {}
+    for label, update in build_updates(build_sessions(rng, args.sessions, args.users, new_user_ids), update_ids):
+        started = time.perf_counter()
+        telebot.TeleBot.process_new_updates(main.bot, [update])
+        latencies.setdefault(label, []).append(time.perf_counter() - started)
+    every = [sample for samples in latencies.values() for sample in samples]
+    results['latency_ms'] = {label: {'p50': percentile(samples, 50), 'p99': percentile(samples, 99)}
+                             for label, samples in sorted(latencies.items())}
+    results['latency_ms']['all'] = {'p50': percentile(every, 50), 'p99': percentile(every, 99)}
+
+    # Пропускна здатність: оновлення розподіляються по потоках-шардах, як під час роботи бота
+    updates = [update for _, update in build_updates(build_sessions(rng, args.sessions, args.users, new_user_ids),
+                                                      update_ids)]
+    started = time.perf_counter()
+    main.bot.process_new_updates(updates)
+    main.bot.join()
+    elapsed = time.perf_counter() - started
+    results['throughput_updates_per_s'] = len(updates) / elapsed
+
+    # Вартість одного save_data для замірів існуючих користувачів
+    today = datetime.now(kiev_timezone).date()
+    costs = []
+    for _ in range(args.sessions):
+        user_id = rng.randint(1, args.users)
+        started = time.perf_counter()
+        service.save_data('measure', user_id, today, 30, 180.0, round(rng.uniform(60, 120), 1))
+        costs.append(time.perf_counter() - started)
+    results['save_data_ms'] = {'p50': percentile(costs, 50), 'p99': percentile(costs, 99)}
+
+    while main.outbox.depth():
+        time.sleep(0.01)
+    results['telegram_requests'] = transport.calls
+    results['rss_mb'] = rss_mb()
+    results['max_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    service.close_data()
+    return results
+
+
+# Порівняння з базою: час і пам'ять не повинні зрости, а пропускна здатність - впасти більше ніж на TOLERANCE
+def compare(results, baseline):
+    regressions = []
+
+    def check(name, value, base, higher_is_better=False):
+        if value is None or not base:
+            return
+        change = (base - value) / base if higher_is_better else (value - base) / base
+        if change > TOLERANCE:
+            regressions.append(f"{name}: {base:.3f} -> {value:.3f} ({change:+.0%})")
+
+    for name in ('startup_s', 'import_main_s', 'load_data_s', 'rss_after_load_mb', 'rss_mb'):
+        check(name, results.get(name), baseline.get(name))
+    check('throughput_updates_per_s', results['throughput_updates_per_s'],
+          baseline.get('throughput_updates_per_s'), higher_is_better=True)
+    for label, values in results['latency_ms'].items():
+        for key, value in values.items():
+            check(f"latency_ms.{label}.{key}", value, baseline.get('latency_ms', {}).get(label, {}).get(key))
+    for key, value in results['save_data_ms'].items():
+        check(f"save_data_ms.{key}", value, baseline.get('save_data_ms', {}).get(key))
+    return regressions
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Налаштування читаються під час імпорту модулів бота, тому задаються заздалегідь
+    os.environ.setdefault('TG_BOT_TOKEN', '0:benchmark')
+    os.environ.setdefault('TG_CHAT_ADMIN', '0')
+    os.environ['STORAGE_BACKEND'] = args.backend
+    sys.path.insert(0, SLIM_TRACKER_DIR)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='slim_tracker_benchmark_') as directory:
+        os.chdir(directory)
+        try:
+            results = run(args)
+        finally:
+            os.chdir(cwd)
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baselines = json.load(file)
+    # База зберігається окремо для кожної конфігурації набору даних
+    key = f"{args.backend}-{args.users}x{args.days}-{args.sessions}"
+    if args.save:
+        baselines[key] = results
+        with open(args.baseline, 'w') as file:
+            json.dump(baselines, file, indent=2, ensure_ascii=False, sort_keys=True)
+        print(f"Базу збережено: {args.baseline} [{key}]")
+    elif key in baselines:
+        regressions = compare(results, baselines[key])
+        for regression in regressions:
+            print(f"Погіршення {regression}")
+        if regressions:
+            sys.exit(1)
+        print("Погіршень відносно бази немає")
+    else:
+        print(f"Бази для {key} немає; запустіть з --save, щоб її зберегти")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import asyncio
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_handler_backends import BaseMiddleware
+from decouple import config
+from models import UserInfo  # старі файли даних посилаються на __main__.UserInfo
+from service import (ADMIN_IDS, user_data, save_data, load_data, close_data, is_admin,
+                     profile_response, top_users_response, population_response, refresh_rollups)
+from rollups import schedule_midnight
+from conversation import (conversation_state, has_conversation, run_step, begin_registration,
+                          begin_measurements, main_menu_markup)
+from speech import warm_up_speech, recognize_speech
+from dispatcher import update_user_id
+from outbox import AsyncOutbox
+from metrics import Gauge, instrument_bot, start_metrics_server
+
+
+API_TOKEN = config('TG_BOT_TOKEN')
+
+
+# Асинхронний бот: різні користувачі обробляються одночасно,
+# а оновлення одного користувача - строго по черзі
+class OrderedAsyncTeleBot(AsyncTeleBot):
+    def __init__(self, token, **kwargs):
+        super().__init__(token, **kwargs)
+        self.user_locks = {}  # user_id -> [замок, кількість очікуючих]
+
+    async def process_new_updates(self, updates):
+        by_user = {}
+        for update in updates:
+            by_user.setdefault(update_user_id(update), []).append(update)
+        await asyncio.gather(*(self._process_user(user_id, user_updates) for user_id, user_updates in by_user.items()))
+
+    async def _process_user(self, user_id, updates):
+        entry = self.user_locks.setdefault(user_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                for update in updates:
+                    await super().process_new_updates([update])
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self.user_locks[user_id]
+
+
+# Стан розмови читається до фільтрів обробників в окремому потоці:
+# з CONVERSATION_STORE=sqlite це запит до бази, який не повинен блокувати цикл подій
+class ConversationMiddleware(BaseMiddleware):
+    def __init__(self):
+        super().__init__()
+        self.update_types = ['message']
+
+    async def pre_process(self, message, data):
+        await asyncio.to_thread(conversation_state, message)
+
+    async def post_process(self, message, data, exception):
+        pass
+
+
+bot = OrderedAsyncTeleBot(API_TOKEN)
+bot.setup_middleware(ConversationMiddleware())
+
+outbox = AsyncOutbox(bot)
+
+
+# Відправлення повідомлень однієї відповіді через чергу: обробник не чекає на мережу,
+# а порядок повідомлень у чаті зберігає черга
+def reply(chat_id, *texts, reply_markup=None):
+    for i, text in enumerate(texts):
+        outbox.send_message(chat_id, text, reply_markup=reply_markup if i == len(texts) - 1 else None)
+
+
+# Перевірка реєстрації з SQLite-сховищем читає користувача з бази, тому виконується в окремому потоці
+async def is_registered(user_id):
+    return await asyncio.to_thread(user_data.__contains__, user_id)
+
+
+# Крок незавершеної розмови (реєстрація, заміри) має пріоритет над іншими обробниками.
+# Кроки можуть записувати дані, тому виконуються в окремому потоці
+@bot.message_handler(func=has_conversation)
+async def handle_conversation_step(message):
+    texts, markup = await asyncio.to_thread(run_step, message)
+    reply(message.chat.id, *texts, reply_markup=markup)
+
+
+@bot.message_handler(commands=['start'])
+async def start_message(message):
+    user_id = message.from_user.id
+    if await is_registered(user_id):
+        reply(message.chat.id, "Ти вже зареєстрований!", "Головне меню:", reply_markup=main_menu_markup())
+    else:
+        texts, markup = await asyncio.to_thread(begin_registration, message)
+        reply(message.chat.id, *texts, reply_markup=markup)
+
+
+@bot.message_handler(func=lambda message: message.text == "Мій профіль 👤")
+async def show_user_info(message):
+    user_id = message.from_user.id
+    if await is_registered(user_id):
+        response = await asyncio.to_thread(profile_response, user_id)
+        reply(message.chat.id, response)
+    else:
+        reply(message.chat.id, "Ти ще не зареєстрований. Будь ласка, почни з реєстрації.")
+
+
+@bot.message_handler(func=lambda message: message.text == "Внести заміри 📏")
+async def input_measurements(message):
+    user_id = message.from_user.id
+    if await is_registered(user_id):
+        texts, markup = await asyncio.to_thread(begin_measurements, message)
+        reply(message.chat.id, *texts, reply_markup=markup)
+    else:
+        reply(message.chat.id, "Ти ще не зареєстрований. Будь ласка, почни з реєстрації.")
+
+@bot.message_handler(func=lambda message: message.text == "Найкращі результати 🏆")
+async def show_top_users(message):
+    reply(message.chat.id, await asyncio.to_thread(top_users_response))
+
+@bot.message_handler(commands=['ім\'я'])
+async def handle_name_change(message):
+    user_id = message.from_user.id
+    if await is_registered(user_id):
+        text = message.text.strip().split()
+        if len(text) > 1:  # Перевіряємо, чи введено нове ім'я
+            new_first_name = ' '.join(text[1:])  # Збираємо нове ім'я з решти слів
+            await asyncio.to_thread(save_data, 'rename', user_id, new_first_name)
+            reply(message.chat.id, f"Ваше ім'я було змінено на {new_first_name}.")
+        else:
+            reply(message.chat.id, "Неправильний формат команди. Використовуйте команду у форматі: /ім'я Ваше нове ім'я.")
+    else:
+        reply(message.chat.id, "Ви ще не зареєстровані. Будь ласка, спочатку зареєструйтесь.")
+
+
+# Зведена статистика по всіх користувачах; для інших користувачів команда спрацює як звичайне повідомлення
+@bot.message_handler(commands=['статистика'], func=lambda message: is_admin(message.from_user.id))
+async def show_population_stats(message):
+    reply(message.chat.id, await asyncio.to_thread(population_response))
+
+
+# Обробник для всіх повідомлень, що не були перехоплені іншими обробниками
+@bot.message_handler(func=lambda message: True)
+async def handle_unhandled_messages(message):
+    user_id = message.from_user.id
+
+    # Перевірка, чи користувач адміністратор
+    if is_admin(user_id):
+        # Пересилання повідомлення всім адміністраторам, крім самого себе
+        # (черга відправки розсилає їх паралельно, обробник не чекає)
+        admin_ids = [admin_id for admin_id in ADMIN_IDS if int(admin_id) != user_id]
+        if message.voice:
+            for admin_id in admin_ids:
+                outbox.send_voice(admin_id, message.voice.file_id, caption=f"{message.text}")
+        else:
+            outbox.broadcast(admin_ids, message.text)
+    else:
+        reply(message.chat.id, "Головне меню:", reply_markup=main_menu_markup())
+
+@bot.message_handler(content_types=['voice'])
+async def handle_voice_message(message):
+    file_info = await bot.get_file(message.voice.file_id)
+    downloaded = await bot.download_file(file_info.file_path)
+
+    # Конвертація та розпізнавання блокують, тому виконуються в окремому потоці
+    text = await asyncio.to_thread(recognize_speech, downloaded)
+    if text is False:
+        text = "Не вдалось розпізнати повідомлення."
+
+    # Далі обробляємо текст так само, як і текстові повідомлення
+    message.text = text
+    await handle_unhandled_messages(message)
+
+
+instrument_bot(bot)
+Gauge('slim_tracker_outbox_depth', "Повідомлення, що чекають на відправку", outbox.depth)
+
+
+async def main():
+    await asyncio.to_thread(load_data)
+    warm_up_speech()
+    start_metrics_server()
+    schedule_midnight(refresh_rollups)
+    try:
+        await bot.polling(non_stop=True)
+    finally:
+        await asyncio.to_thread(close_data)
+        await bot.close_session()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,193 @@
+import fcntl
+import json
+import os
+import sqlite3
+import threading
+import time
+from decouple import config
+
+# Режим кількох процесів: кожен процес обслуговує свою частину користувачів (user_id % SHARD_COUNT),
+# а один із них, що тримає файлове блокування, отримує оновлення від Telegram і розкладає їх
+# по чергах процесів у спільній SQLite-базі. Дані користувачів і стан розмов теж спільні (SQLite),
+# тому перезапущений процес продовжує з того місця, де зупинився.
+# Запуск: SHARD_COUNT=4 SHARD_INDEX=0 python cluster.py
+SHARD_COUNT = config('SHARD_COUNT', default=1, cast=int)
+SHARD_INDEX = config('SHARD_INDEX', default=0, cast=int)
+
+# Налаштування, які читаються під час імпорту модулів бота
+os.environ.setdefault('STORAGE_BACKEND', 'sqlite')
+os.environ.setdefault('CONVERSATION_STORE', 'sqlite')
+# Ліміт Telegram на бота ділиться між процесами
+os.environ.setdefault('OUTBOX_GLOBAL_RATE', str(30 / SHARD_COUNT))
+
+import telebot
+from telebot import apihelper, types
+import service
+from service import load_data, close_data, refresh_rollups, build_leaderboard
+from conversation import CONVERSATION_STORE
+from speech import warm_up_speech
+from dispatcher import update_user_id
+from rollups import schedule_midnight
+from metrics import METRICS_PORT, Gauge, start_metrics_server
+from main import API_TOKEN, bot
+
+logger = telebot.logger
+
+UPDATES_FILE = "updates.sqlite3"
+LOCK_FILE = "poller.lock"
+POLL_TIMEOUT = 25
+BATCH_SIZE = 100
+# Скільки взятих з черги оновлень процес обробляє одночасно
+MAX_IN_FLIGHT = 1000
+IDLE_DELAY = 0.1
+LEADER_RETRY = 5
+# Як часто таблиця результатів перечитується зі спільного сховища (в ній є заміри всіх процесів)
+LEADERBOARD_REFRESH = config('LEADERBOARD_REFRESH', default=60, cast=int)
+
+
+def shard_of(user_id, shard_count=SHARD_COUNT):
+    return user_id % shard_count
+
+
+# Спільна черга оновлень: рядок видаляється одразу після обробки самого оновлення,
+# тому після падіння процесу повторно обробляються лише ті, що саме оброблялись
+class UpdateQueue:
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            # Підтвердження пишуться на кожне оновлення; падіння процесу їх не втрачає і без fsync
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS updates (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                shard INTEGER,
+                payload TEXT)""")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS updates_shard ON updates (shard, id)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS poller (key TEXT PRIMARY KEY, value INTEGER)")
+
+    def offset(self):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM poller WHERE key = 'offset'").fetchone()
+        return row[0] if row else None
+
+    # Оновлення і новий offset записуються однією транзакцією: новий лідер не втратить і не повторить їх
+    def push(self, updates, offset):
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT INTO updates (shard, payload) VALUES (?, ?)", updates)
+            self.conn.execute("INSERT OR REPLACE INTO poller VALUES ('offset', ?)", (offset,))
+
+    # Рядки з номером після after: взяті раніше, але ще не підтверджені, повторно не беруться
+    def take(self, shard, after=0, limit=BATCH_SIZE):
+        with self.lock:
+            return self.conn.execute("SELECT id, payload FROM updates WHERE shard = ? AND id > ? ORDER BY id LIMIT ?",
+                                     (shard, after, limit)).fetchall()
+
+    def ack(self, ids):
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM updates WHERE id = ?", [(update_id,) for update_id in ids])
+
+    def depth(self, shard):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM updates WHERE shard = ?", (shard,)).fetchone()[0]
+
+
+# Отримання оновлень від Telegram. Працює лише в процесі, що захопив блокування LOCK_FILE;
+# після падіння лідера блокування звільняється, і його підхоплює інший процес
+def run_poller(updates_queue):
+    lock_file = open(LOCK_FILE, 'w')
+    while True:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            break
+        except BlockingIOError:
+            time.sleep(LEADER_RETRY)
+    logger.info("Процес %s отримує оновлення від Telegram", SHARD_INDEX)
+
+    # Помилка бази (наприклад, "database is locked") не повинна зупинити потік: процес тримав би
+    # блокування, і оновлення не отримував би ніхто. Якщо оновлення не записались, offset теж
+    # не змінився, тож вони просто отримаються ще раз
+    while True:
+        try:
+            updates = apihelper.get_updates(API_TOKEN, offset=updates_queue.offset(), limit=BATCH_SIZE,
+                                            long_polling_timeout=POLL_TIMEOUT)
+            if updates:
+                rows = []
+                for update in updates:
+                    user_id = update_user_id(types.Update.de_json(update))
+                    rows.append((shard_of(user_id), json.dumps(update)))
+                updates_queue.push(rows, updates[-1]['update_id'] + 1)
+        except Exception:
+            logger.exception("Не вдалось отримати або записати оновлення")
+            time.sleep(LEADER_RETRY)
+
+
+def run_leaderboard_refresh():
+    while True:
+        time.sleep(LEADERBOARD_REFRESH)
+        try:
+            build_leaderboard()
+        except Exception:
+            logger.exception("Не вдалось оновити таблицю результатів")
+
+
+# Обробка своєї черги. Кроки розмов не ідемпотентні, тому кожне оновлення підтверджується
+# одразу після обробки, а не разом з пакетом. Нові рядки беруться, не чекаючи на обробку
+# попередніх (повільне оновлення затримує лише свого користувача); в роботі одночасно
+# не більше MAX_IN_FLIGHT оновлень
+def run_worker(updates_queue):
+    in_flight = set()
+    lock = threading.Lock()
+
+    def processed(update):
+        try:
+            updates_queue.ack([update.queue_id])
+        except Exception:
+            # Непідтверджене оновлення обробиться ще раз лише після перезапуску процесу
+            logger.exception("Не вдалось підтвердити оновлення %s", update.update_id)
+        with lock:
+            in_flight.discard(update.queue_id)
+
+    bot.on_processed = processed
+    last_taken = 0
+    while True:
+        with lock:
+            free = MAX_IN_FLIGHT - len(in_flight)
+        rows = updates_queue.take(SHARD_INDEX, last_taken, min(free, BATCH_SIZE)) if free > 0 else []
+        if not rows:
+            time.sleep(IDLE_DELAY)
+            continue
+        updates = []
+        for queue_id, payload in rows:
+            update = types.Update.de_json(payload)
+            update.queue_id = queue_id
+            updates.append(update)
+        last_taken = rows[-1][0]
+        with lock:
+            in_flight.update(queue_id for queue_id, _ in rows)
+        bot.process_new_updates(updates)
+
+
+def main():
+    if service.STORAGE_BACKEND != 'sqlite' or CONVERSATION_STORE != 'sqlite':
+        raise SystemExit("Режим кількох процесів потребує STORAGE_BACKEND=sqlite і CONVERSATION_STORE=sqlite")
+    if not 0 <= SHARD_INDEX < SHARD_COUNT:
+        raise SystemExit(f"SHARD_INDEX має бути від 0 до {SHARD_COUNT - 1}")
+
+    load_data()
+    warm_up_speech()
+    updates_queue = UpdateQueue(UPDATES_FILE)
+    Gauge('slim_tracker_shard_queue_depth', "Оновлення в спільній черзі цього процесу",
+          lambda: updates_queue.depth(SHARD_INDEX))
+    start_metrics_server(METRICS_PORT + SHARD_INDEX if METRICS_PORT else 0)
+    schedule_midnight(refresh_rollups)
+    threading.Thread(target=run_poller, args=(updates_queue,), daemon=True, name='poller').start()
+    threading.Thread(target=run_leaderboard_refresh, daemon=True, name='leaderboard').start()
+    try:
+        run_worker(updates_queue)
+    finally:
+        close_data()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+import json
+import sqlite3
+import threading
+import time
+from telebot import types
+from decouple import config
+from datetime import datetime
+from models import kiev_timezone
+from service import user_data, save_data
+from metrics import timed_step
+
+# Незавершені розмови видаляються через CONVERSATION_TTL секунд бездіяльності
+CONVERSATION_TTL = config('CONVERSATION_TTL', default=24 * 3600, cast=int)
+# memory - стан у пам'яті процесу; sqlite - спільний для всіх процесів файл
+CONVERSATION_STORE = config('CONVERSATION_STORE', default='memory')
+CONVERSATIONS_FILE = "conversations.sqlite3"
+SWEEP_EVERY = 1000
+
+
+# Стан розмов у пам'яті процесу: user_id -> (крок, дані, час завершення)
+class MemoryStateStore:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.states = {}
+        self.lock = threading.Lock()
+        self.writes = 0
+
+    def get(self, user_id):
+        with self.lock:
+            entry = self.states.get(user_id)
+            if entry is None:
+                return None
+            state, data, expires = entry
+            if expires < time.time():
+                del self.states[user_id]
+                return None
+            return state, data
+
+    def set(self, user_id, state, data):
+        with self.lock:
+            self.states[user_id] = (state, data, time.time() + self.ttl)
+            self.writes += 1
+            if self.writes % SWEEP_EVERY == 0:
+                now = time.time()
+                self.states = {key: entry for key, entry in self.states.items() if entry[2] >= now}
+
+    def delete(self, user_id):
+        with self.lock:
+            self.states.pop(user_id, None)
+
+
+# Стан розмов у SQLite, доступний кільком процесам одночасно
+class SQLiteStateStore:
+    def __init__(self, path, ttl):
+        self.ttl = ttl
+        self.conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.writes = 0
+        with self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS conversations (
+                user_id INTEGER PRIMARY KEY,
+                state TEXT,
+                data TEXT,
+                expires REAL)""")
+
+    def get(self, user_id):
+        with self.lock:
+            row = self.conn.execute("SELECT state, data FROM conversations WHERE user_id = ? AND expires >= ?",
+                                    (user_id, time.time())).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def set(self, user_id, state, data):
+        with self.lock, self.conn:
+            now = time.time()
+            self.conn.execute("INSERT OR REPLACE INTO conversations VALUES (?, ?, ?, ?)",
+                              (user_id, state, json.dumps(data), now + self.ttl))
+            self.writes += 1
+            if self.writes % SWEEP_EVERY == 0:
+                self.conn.execute("DELETE FROM conversations WHERE expires < ?", (now,))
+
+    def delete(self, user_id):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM conversations WHERE user_id = ?", (user_id,))
+
+
+if CONVERSATION_STORE == 'sqlite':
+    conversations = SQLiteStateStore(CONVERSATIONS_FILE, CONVERSATION_TTL)
+else:
+    conversations = MemoryStateStore(CONVERSATION_TTL)
+
+
+def main_menu_markup():
+    markup = types.ReplyKeyboardMarkup(row_width=3, resize_keyboard=True)
+    markup.add('Мій профіль 👤', 'Внести заміри 📏', 'Найкращі результати 🏆')
+    return markup
+
+def next_markup():
+    markup = types.ReplyKeyboardMarkup(one_time_keyboard=True)
+    markup.add('Далі')
+    return markup
+
+
+# Кроки розмов. Кожен крок отримує повідомлення та дані розмови і повертає
+# (тексти відповіді, клавіатура для останнього тексту, наступний крок або None)
+STEPS = {}
+
+def step(name):
+    def register(function):
+        STEPS[name] = timed_step(name, function)
+        return function
+    return register
+
+
+# Стан розмови читається один раз на повідомлення і зберігається в ньому:
+# фільтр обробника і run_step не звертаються до сховища двічі
+def conversation_state(message):
+    if not hasattr(message, 'conversation'):
+        message.conversation = conversations.get(message.from_user.id)
+    return message.conversation
+
+def has_conversation(message):
+    return conversation_state(message) is not None
+
+def run_step(message):
+    user_id = message.from_user.id
+    state = conversation_state(message)
+    if state is None:
+        return [], None
+    name, data = state
+    texts, markup, next_state = STEPS[name](message, data)
+    if next_state is None:
+        conversations.delete(user_id)
+    else:
+        conversations.set(user_id, next_state, data)
+    return texts, markup
+
+
+def begin_registration(message):
+    conversations.set(message.from_user.id, 'gender', {'first_name': message.from_user.first_name})
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
+    markup.add('👨', '👩')
+    return ["Привіт, наш улюблений ласун! 🍩😋\nЯкщо ти готовий до змін і хочеш разом з нами досягти нових висот, я тут, щоб підтримати тебе на кожному кроці. 💪🚀\nРазом ми подолаємо зайві кілограми і зробимо цей шлях цікавим і результативним! 🌟🎉",
+            "Щоб ми могли правильно розрахувати твій ІМТ (індекс маси тіла), будь ласка, вибери свою стать, натиснувши на відповідну кнопку нижче. 👇😊"], markup
+
+@step('gender')
+def process_gender(message, data):
+    data['gender'] = message.text.lower()
+    return ["Введи будь ласка свій вік ✏️.\nОбіцяємо, це залишиться між нами! 😉"], None, 'age'
+
+@step('age')
+def process_age(message, data):
+    try:
+        data['age'] = int(message.text)
+    except ValueError:
+        return ["Будь ласка, введи вік в числовому форматі!"], None, 'age'
+    return ["Тепер введи свій зріст в сантиметрах ✏️."], None, 'height'
+
+@step('height')
+def process_height(message, data):
+    try:
+        data['height'] = float(message.text)
+    except ValueError:
+        return ["Будь ласка, введи зріст в числовому форматі!"], None, 'height'
+    return ["А тепер, наостанок, введи свою вагу в кілограмах ✏️."], None, 'weight'
+
+@step('weight')
+def process_weight(message, data):
+    try:
+        weight = float(message.text)
+    except ValueError:
+        return ["Будь ласка, введи вагу в числовому форматі!"], None, 'weight'
+
+    # Зберегти профіль і додати нові виміри до списку
+    user_id = message.from_user.id
+    today = datetime.now(kiev_timezone).date()
+    save_data('register', user_id, data['gender'], data['first_name'], data['age'], data['height'], weight)
+    save_data('measure', user_id, today, data['age'], data['height'], weight)
+
+    return ["Вітаю на борту! 🚀\nТепер ти офіційно в нашій команді супергероїв зі схуднення!\nГотовий до нових звершень? 😎",
+            "Головне меню:"], main_menu_markup(), None
+
+
+def begin_measurements(message):
+    user_info = user_data[message.from_user.id]
+    conversations.set(message.from_user.id, 'measurement_age', {})
+    return [f"Ваш поточний вік: {user_info.age}. Якщо він не змінився, натисніть кнопку 'Далі', або введіть нове значення.",
+            "Вік:"], next_markup()
+
+@step('measurement_age')
+def process_measurement_age(message, data):
+    user_info = user_data[message.from_user.id]
+    if message.text == 'Далі':
+        data['age'] = user_info.age
+    else:
+        try:
+            data['age'] = int(message.text)
+        except ValueError:
+            return ["Будь ласка, введи вік в числовому форматі!"], None, 'measurement_age'
+
+    return [f"Ваш поточний зріст: {user_info.height} см. Якщо він не змінився, натисніть кнопку 'Далі', або введіть нове значення.",
+            "Зріст:"], next_markup(), 'measurement_height'
+
+@step('measurement_height')
+def process_measurement_height(message, data):
+    user_info = user_data[message.from_user.id]
+    if message.text == 'Далі':
+        data['height'] = user_info.height
+    else:
+        try:
+            data['height'] = float(message.text)
+        except ValueError:
+            return ["Будь ласка, введи зріст в числовому форматі!"], None, 'measurement_height'
+
+    return [f"Ваша поточна вага: {user_info.weight} кг. Якщо вона не змінилась, натисніть кнопку 'Далі', або введіть нове значення.",
+            "Вага:"], next_markup(), 'measurement_weight'
+
+@step('measurement_weight')
+def process_measurement_weight(message, data):
+    user_id = message.from_user.id
+    if message.text == 'Далі':
+        weight = user_data[user_id].weight
+    else:
+        try:
+            weight = float(message.text)
+        except ValueError:
+            return ["Будь ласка, введи вагу в числовому форматі!"], None, 'measurement_weight'
+
+    today = datetime.now(kiev_timezone).date()
+    save_data('measure', user_id, today, data['age'], data['height'], weight)
+
+    return ["Дані збережені!", "Головне меню:"], main_menu_markup(), None
@@ -0,0 +1,52 @@
+import queue
+import threading
+import telebot
+
+logger = telebot.logger
+
+
+# Користувач, від якого надійшло оновлення (ключ для впорядкування обробки)
+def update_user_id(update):
+    for event in (update.message, update.edited_message, update.callback_query):
+        if event is not None and event.from_user is not None:
+            return event.from_user.id
+    return update.update_id
+
+
+# Бот, що обробляє оновлення паралельно на кількох потоках.
+# Оновлення одного користувача завжди потрапляють в один і той самий потік,
+# тому кроки register_next_step_handler виконуються по черзі
+class ShardedTeleBot(telebot.TeleBot):
+    def __init__(self, token, workers, **kwargs):
+        super().__init__(token, threaded=False, **kwargs)
+        self.shards = [queue.Queue() for _ in range(workers)]
+        self.on_processed = None  # викликається з оновленням після його обробки (cluster.py)
+        for shard in self.shards:
+            threading.Thread(target=self._process_shard, args=(shard,), daemon=True).start()
+
+    # Оновлення лише ставляться в черги, тому offset для наступного getUpdates зсувається тут,
+    # а не після обробки: інакше polling отримав би ті самі оновлення ще раз
+    def process_new_updates(self, updates):
+        for update in updates:
+            self.last_update_id = max(self.last_update_id, update.update_id)
+            self.shards[update_user_id(update) % len(self.shards)].put(update)
+
+    def _process_shard(self, shard):
+        while True:
+            update = shard.get()
+            try:
+                super().process_new_updates([update])
+            except Exception:
+                logger.exception("Помилка обробки оновлення %s", update.update_id)
+            finally:
+                if self.on_processed is not None:
+                    self.on_processed(update)
+                shard.task_done()
+
+    def queue_depth(self):
+        return sum(shard.qsize() for shard in self.shards)
+
+    # Очікування, доки всі отримані оновлення будуть оброблені
+    def join(self):
+        for shard in self.shards:
+            shard.join()
@@ -0,0 +1,145 @@
+import threading
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from models import kiev_timezone
+
+WINDOW_DAYS = 7
+
+
+# Таблиця найкращих результатів, яка оновлюється при кожному замірі
+# замість повного перерахунку по всіх користувачах. Тримає лише підсумок
+# за останні WINDOW_DAYS днів, тому не потребує всіх користувачів у пам'яті.
+# limit - скільки перших місць показується (None - всі)
+class Leaderboard:
+    def __init__(self, limit=None):
+        self.lock = threading.Lock()
+        self.limit = limit
+        self.day = None
+        self.names = {}  # імена лише тих, хто має заміри у вікні
+        self.windows = {}  # user_id -> {дата: вага} за останні WINDOW_DAYS днів
+        self.changes = {}  # user_id -> відсоткова зміна ваги
+        self.ranking = []  # відсортовані пари (зміна, user_id)
+        self.version = 0  # збільшується, лише коли змінились показані місця або імена на них
+
+    def _week_ago(self):
+        return self.day - timedelta(days=WINDOW_DAYS)
+
+    # Показані місця: з ними порівнюється таблиця до і після зміни
+    def _head(self):
+        return self.ranking[:self.limit]
+
+    def _shown(self):
+        return [(percentage_change, self.names.get(user_id)) for percentage_change, user_id in self._head()]
+
+    def build(self, names, recent_measurements):
+        with self.lock:
+            shown = self._shown()
+            self.day = datetime.now(kiev_timezone).date()
+            self.names = dict(names)
+            self.windows = {}
+            self.changes = {}
+            self.ranking = []
+            for user_id, measurements in recent_measurements.items():
+                self.windows[user_id] = dict(measurements)
+                self._update(user_id)
+            if self._shown() != shown:
+                self.version += 1
+
+    # Підміна вмісту таблицею, перебудованою без замка (service.build_leaderboard)
+    def replace(self, other):
+        with self.lock:
+            shown = self._shown()
+            self.day, self.names, self.windows = other.day, other.names, other.windows
+            self.changes, self.ranking = other.changes, other.ranking
+            if self._shown() != shown:
+                self.version += 1
+
+    # name - поточне ім'я користувача, якого стосується запис
+    def apply(self, record, name):
+        op, user_id, *args = record
+        with self.lock:
+            self._rollover()
+            head = self._head()
+            renamed = False
+            if op == 'rename' and user_id in self.names:
+                renamed = self.names[user_id] != name
+                self.names[user_id] = name
+            elif op == 'measure':
+                date, weight = args[0], args[3]
+                if date >= self._week_ago():
+                    renamed = self.names.get(user_id) != name
+                    self.names[user_id] = name
+                    self.windows.setdefault(user_id, {})[date] = weight
+                    self._update(user_id)
+            if self._head() != head or renamed and any(ranked_id == user_id for _, ranked_id in head):
+                self.version += 1
+
+    def _remove(self, user_id):
+        old_change = self.changes.pop(user_id, None)
+        if old_change is not None:
+            del self.ranking[bisect_left(self.ranking, (old_change, user_id))]
+
+    def _update(self, user_id):
+        self._remove(user_id)
+        window = self.windows[user_id]
+        if len(window) < 2:
+            return
+
+        initial_weight = Decimal(str(window[min(window)]))
+        final_weight = Decimal(str(window[max(window)]))
+        try:
+            if initial_weight == Decimal('0'):
+                percentage_change = Decimal('inf')  # Avoid division by zero
+            else:
+                percentage_change = ((final_weight - initial_weight) / initial_weight) * Decimal('100')
+        except InvalidOperation:
+            percentage_change = Decimal('inf')
+
+        self.changes[user_id] = percentage_change
+        insort(self.ranking, (percentage_change, user_id))
+
+    # Щоденне зміщення вікна: відкидаємо заміри, старші за WINDOW_DAYS днів
+    def _rollover(self):
+        today = datetime.now(kiev_timezone).date()
+        if today == self.day:
+            return
+        shown = self._shown()
+        self.day = today
+        week_ago = self._week_ago()
+        for user_id in list(self.windows):
+            window = self.windows[user_id]
+            expired = [date for date in window if date < week_ago]
+            if not expired:
+                continue
+            for date in expired:
+                del window[date]
+            if window:
+                self._update(user_id)
+            else:
+                del self.windows[user_id]
+                self.names.pop(user_id, None)
+                self._remove(user_id)
+        if self._shown() != shown:
+            self.version += 1
+
+    def rollover(self):
+        with self.lock:
+            self._rollover()
+
+    def top(self, limit=None):
+        if limit is None:
+            limit = self.limit
+        with self.lock:
+            self._rollover()
+            ranking = self.ranking if limit is None else self.ranking[:limit]
+            top_users = []
+            for percentage_change, user_id in ranking:
+                if percentage_change < 0:
+                    status = "зменшення ваги на"
+                elif percentage_change > 0:
+                    status = "збільшення ваги на"
+                else:
+                    status = "без змін"
+                top_users.append((self.names.get(user_id), percentage_change, status))
+            return top_users
@@ -0,0 +1,269 @@
+import asyncio
+import functools
+import sys
+import threading
+import time
+import traceback
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import telebot
+from decouple import config
+
+logger = telebot.logger
+
+# Порт локального HTTP /metrics; 0 - вимкнено
+METRICS_PORT = config('METRICS_PORT', default=0, cast=int)
+# Запити, довші за цей поріг (секунди), профілюються вибірково; 0 - профайлер вимкнено
+PROFILE_SLOW_SECONDS = config('PROFILE_SLOW_SECONDS', default=0.0, cast=float)
+PROFILE_INTERVAL = 0.005
+PROFILE_TOP_STACKS = 5
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+registry = []
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+# Метрики у текстовому форматі Prometheus; значення зберігаються окремо для кожного набору міток
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, value) for key, value in self.values.items()]
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.values = {}  # мітки -> [лічильники кошиків, сума, кількість]
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        result = []
+        with self.lock:
+            for key, (counts, total, count) in self.values.items():
+                for bound, bucket_count in zip(self.buckets, counts):
+                    result.append((f"{self.name}_bucket", key + (('le', bound),), bucket_count))
+                result.append((f"{self.name}_bucket", key + (('le', '+Inf'),), count))
+                result.append((f"{self.name}_sum", key, total))
+                result.append((f"{self.name}_count", key, count))
+        return result
+
+
+# Значення, яке зчитується в момент запиту (наприклад, довжина черги)
+class Gauge:
+    kind = 'gauge'
+
+    def __init__(self, name, help, function):
+        self.name = name
+        self.help = help
+        self.function = function
+        registry.append(self)
+
+    def samples(self):
+        try:
+            return [(self.name, (), self.function())]
+        except Exception:
+            logger.exception("Не вдалось прочитати метрику %s", self.name)
+            return []
+
+
+def render():
+    lines = []
+    for metric in registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+HANDLER_SECONDS = Histogram('slim_tracker_handler_seconds', "Час обробки повідомлення обробником")
+HANDLER_ERRORS = Counter('slim_tracker_handler_errors_total', "Винятки в обробниках повідомлень")
+STEP_SECONDS = Histogram('slim_tracker_step_seconds', "Час виконання кроку розмови")
+STEP_ERRORS = Counter('slim_tracker_step_errors_total', "Винятки в кроках розмови")
+STORAGE_SECONDS = Histogram('slim_tracker_storage_seconds', "Час операцій зі сховищем")
+SPEECH_SECONDS = Histogram('slim_tracker_speech_seconds', "Час декодування та розпізнавання голосу")
+RENDER_SECONDS = Histogram('slim_tracker_render_seconds', "Час формування тексту відповіді")
+TELEGRAM_SECONDS = Histogram('slim_tracker_telegram_seconds', "Час запитів до Telegram Bot API")
+TELEGRAM_ERRORS = Counter('slim_tracker_telegram_errors_total', "Невдалі запити до Telegram Bot API")
+
+
+# Вибірковий профайлер: фоновий потік періодично знімає стеки запитів, що обробляються
+# довше за PROFILE_SLOW_SECONDS, і після завершення такого запиту пише найчастіші стеки в лог.
+# Для асинхронних обробників знімається стек задачі asyncio: потік циклу подій у цей момент
+# може виконувати зовсім іншу корутину
+class SlowRequestProfiler:
+    def __init__(self, threshold, interval=PROFILE_INTERVAL):
+        self.threshold = threshold
+        self.interval = interval
+        self.active = {}  # ідентифікатор запиту -> [назва, потік, задача або None, початок, стеки]
+        self.lock = threading.Lock()
+        threading.Thread(target=self._sample, daemon=True).start()
+
+    def _sample(self):
+        while True:
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            with self.lock:
+                slow = [entry for entry in self.active.values() if now - entry[3] > self.threshold]
+            if not slow:
+                continue
+            frames = sys._current_frames()
+            for entry in slow:
+                stack = self._task_stack(entry[2]) if entry[2] is not None else self._thread_stack(frames.get(entry[1]))
+                if stack:
+                    entry[4][stack] += 1
+
+    @staticmethod
+    def _thread_stack(frame):
+        return tuple(traceback.format_stack(frame)) if frame is not None else None
+
+    @staticmethod
+    def _task_stack(task):
+        stack = task.get_stack()
+        return tuple(traceback.StackSummary.extract((frame, frame.f_lineno) for frame in stack).format())
+
+    @contextmanager
+    def watch(self, name):
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        token = object()
+        entry = [name, threading.get_ident(), task, time.perf_counter(), StackCounter()]
+        with self.lock:
+            self.active[token] = entry
+        try:
+            yield
+        finally:
+            with self.lock:
+                del self.active[token]
+            if entry[4]:
+                self._report(entry)
+
+    def _report(self, entry):
+        name, _, _, started, stacks = entry
+        total = sum(stacks.values())
+        report = [f"Повільний запит {name}: {time.perf_counter() - started:.3f} с, {total} вибірок"]
+        for stack, count in stacks.most_common(PROFILE_TOP_STACKS):
+            report.append(f"--- {count}/{total}\n{''.join(stack[-8:])}")
+        logger.error("\n".join(report))
+
+
+profiler = SlowRequestProfiler(PROFILE_SLOW_SECONDS) if PROFILE_SLOW_SECONDS > 0 else None
+
+
+@contextmanager
+def _observe(histogram, errors, name, labels):
+    started = time.perf_counter()
+    try:
+        if profiler is not None:
+            with profiler.watch(name):
+                yield
+        else:
+            yield
+    except Exception:
+        errors.inc(**labels)
+        raise
+    finally:
+        histogram.observe(time.perf_counter() - started, **labels)
+
+
+def timed_step(name, function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with _observe(STEP_SECONDS, STEP_ERRORS, f"step {name}", {'step': name}):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+def _timed_handler(function):
+    name = function.__name__
+    labels = {'handler': name}
+    if asyncio.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            with _observe(HANDLER_SECONDS, HANDLER_ERRORS, f"handler {name}", labels):
+                return await function(*args, **kwargs)
+    else:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with _observe(HANDLER_SECONDS, HANDLER_ERRORS, f"handler {name}", labels):
+                return function(*args, **kwargs)
+    return wrapper
+
+
+# Обгортання всіх зареєстрованих обробників повідомлень таймерами та лічильниками помилок
+def instrument_bot(bot):
+    for handler in bot.message_handlers:
+        handler['function'] = _timed_handler(handler['function'])
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Локальний HTTP-сервер з метриками у фоновому потоці
+def start_metrics_server(port=METRICS_PORT):
+    if not port:
+        return None
+    server = ThreadingHTTPServer(('127.0.0.1', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,273 @@
+import pytz
+from array import array
+from bisect import bisect_left
+from datetime import date as date_type, datetime, timedelta
+from decimal import Decimal
+kiev_timezone = pytz.timezone("Europe/Kiev")
+
+
+# Компактний ряд замірів: паралельні масиви, відсортовані за датою (порядковий номер дня)
+class MeasurementSeries:
+    __slots__ = ('days', 'weights', 'ages', 'heights')
+
+    def __init__(self, measurements=()):
+        self.days = array('i')
+        self.weights = array('f')
+        self.ages = array('i')
+        self.heights = array('f')
+        for m in sorted(measurements, key=lambda m: m['date']):
+            self.upsert(m['date'], m['age'], m['height'], m['weight'])
+
+    def __getstate__(self):
+        return self.days, self.weights, self.ages, self.heights
+
+    def __setstate__(self, state):
+        self.days, self.weights, self.ages, self.heights = state
+
+    def __len__(self):
+        return len(self.days)
+
+    def copy(self):
+        series = MeasurementSeries()
+        series.days, series.weights, series.ages, series.heights = \
+            self.days[:], self.weights[:], self.ages[:], self.heights[:]
+        return series
+
+    def __iter__(self):
+        return (self._measurement(i) for i in range(len(self.days)))
+
+    # float32 зберігає вагу з похибкою, тому округлюємо при читанні
+    def _measurement(self, i):
+        age = self.ages[i]
+        height = self.heights[i]
+        return {
+            'date': date_type.fromordinal(self.days[i]),
+            'age': None if age == -1 else age,
+            'height': None if height != height else round(height, 2),
+            'weight': round(self.weights[i], 2),
+        }
+
+    def get(self, date):
+        day = date.toordinal()
+        i = bisect_left(self.days, day)
+        if i < len(self.days) and self.days[i] == day:
+            return self._measurement(i)
+        return None
+
+    def upsert(self, date, age, height, weight):
+        day = date.toordinal()
+        age = -1 if age is None else age
+        height = float('nan') if height is None else height
+        # Зазвичай заміри додаються за сьогодні - це перевіряється без пошуку
+        if self.days and self.days[-1] == day:
+            i = len(self.days) - 1
+        elif not self.days or self.days[-1] < day:
+            self.days.append(day)
+            self.weights.append(weight)
+            self.ages.append(age)
+            self.heights.append(height)
+            return
+        else:
+            i = bisect_left(self.days, day)
+            if self.days[i] != day:
+                self.days.insert(i, day)
+                self.weights.insert(i, weight)
+                self.ages.insert(i, age)
+                self.heights.insert(i, height)
+                return
+        self.weights[i] = weight
+        self.ages[i] = age
+        self.heights[i] = height
+
+    def since(self, date):
+        start = bisect_left(self.days, date.toordinal())
+        return [self._measurement(i) for i in range(start, len(self.days))]
+
+    def weights_since(self, date):
+        start = bisect_left(self.days, date.toordinal())
+        return [round(weight, 2) for weight in self.weights[start:]]
+
+    def latest(self, count):
+        return [self._measurement(i) for i in range(max(len(self.days) - count, 0), len(self.days))]
+
+    def arrays(self):
+        return self.days, self.weights
+
+
+class UserInfo:
+    __slots__ = ('gender', 'first_name', 'age', 'height', 'weight', 'measurements')
+
+    def __init__(self, gender=None, first_name=None, age=None, height=None, weight=None):
+        self.gender = gender
+        self.first_name = first_name
+        self.age = age
+        self.height = height
+        self.weight = weight
+        self.measurements = MeasurementSeries()
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        # Старі файли даних зберігали заміри списком словників
+        if isinstance(state.get('measurements', []), list):
+            state['measurements'] = MeasurementSeries(state.get('measurements', []))
+        for name in self.__slots__:
+            setattr(self, name, state.get(name))
+
+    def copy(self):
+        user_info = UserInfo(self.gender, self.first_name, self.age, self.height, self.weight)
+        user_info.measurements = self.measurements.copy()
+        return user_info
+
+    def add_measurement(self, age, height, weight, today=None):
+        if today is None:
+            today = datetime.now(kiev_timezone).date()
+        self.measurements.upsert(today, age, height, weight)
+
+    def calculate_bmi(self):
+        return self.weight / ((self.height / 100) ** 2)
+
+    def get_optimal_weight(self):
+        min_bmi, max_bmi = 18.5, 24.9
+        if self.age < 18:
+            if self.gender == '👨':
+                if self.age < 6:
+                    min_bmi, max_bmi = 14.0, 19.0
+                elif self.age < 12:
+                    min_bmi, max_bmi = 16.0, 22.0
+                else:
+                    min_bmi, max_bmi = 17.0, 23.0
+            else:
+                if self.age < 6:
+                    min_bmi, max_bmi = 13.5, 18.5
+                elif self.age < 12:
+                    min_bmi, max_bmi = 15.5, 21.5
+                else:
+                    min_bmi, max_bmi = 16.5, 22.5
+        else:
+            min_weight = min_bmi * (self.height / 100) ** 2
+            max_weight = max_bmi * (self.height / 100) ** 2
+            return round(min_weight, 1), round(max_weight, 1)
+
+    def get_health_status(self):
+        bmi = self.calculate_bmi()
+        optimal_weight_range = self.get_optimal_weight()
+        status = []
+
+        if self.age < 18:
+            status.append("Оцінка BMI для дітей та підлітків може бути специфічною.")
+        else:
+            if bmi < 18.5:
+                status.append("Недостатня вага")
+            elif 18.5 <= bmi < 24.9:
+                status.append("Нормальна вага")
+            elif 25.0 <= bmi < 29.9:
+                status.append("Надмірна вага")
+            elif 30.0 <= bmi < 34.9:
+                status.append("Ожиріння 1 ступеня (легке)")
+            elif 35.0 <= bmi < 39.9:
+                status.append("Ожиріння 2 ступеня (помірне)")
+            else:  # bmi >= 40.0
+                status.append("Ожиріння 3 ступеня (важке)")
+
+        status.append(f"Оптимально для вас: {optimal_weight_range[0]} - {optimal_weight_range[1]} кг")
+        return ", ".join(status)
+
+    def get_last_measurements(self):
+        today = datetime.now(kiev_timezone).date()
+        yesterday = today - timedelta(days=1)
+        measurement_today = self.measurements.get(today)
+        measurement_yesterday = self.measurements.get(yesterday)
+        result = ""
+        if measurement_today:
+            result += f"Сьогодні: Вага {measurement_today['weight']} кг\n"
+        else:
+            result += "Сьогодні: Немає даних\n"
+        if measurement_yesterday:
+            result += f"Вчора: Вага {measurement_yesterday['weight']} кг\n"
+        else:
+            result += "Вчора: Немає даних\n"
+        if not measurement_today and not measurement_yesterday:
+            last_measurement = self.measurements.latest(1)
+            if last_measurement:
+                last_measurement_date = last_measurement[0]['date']
+                result += f"Останній замір: {last_measurement_date.day}.{last_measurement_date.month}\n"
+        return result
+
+    def get_weight_difference(self):
+        # Отримуємо останнє та попереднє вимірювання
+        last_measurements = self.measurements.latest(2)
+        if len(last_measurements) < 2:
+            return "Немає достатньо даних для обчислення різниці."
+
+        previous_measurement, last_measurement = last_measurements
+
+        # Використовуємо Decimal для точних обчислень
+        last_weight = Decimal(str(last_measurement['weight']))
+        previous_weight = Decimal(str(previous_measurement['weight']))
+
+        # Обчислюємо різницю
+        difference = last_weight - previous_weight
+
+        return f"{difference:.2f} кг"
+
+    def get_average_weight_change(self, days):
+        today = datetime.now(kiev_timezone).date()
+        past_date = today - timedelta(days=days)
+        weights = self.measurements.weights_since(past_date)
+        if len(weights) < 2:
+            return f"Немає достатньо даних за останні {days} днів."
+        total_change = sum(weights[i] - weights[i + 1] for i in range(len(weights) - 1))
+        average_change = total_change / (len(weights) - 1)
+        if average_change > 0:
+            return f"Середній приріст ваги за останні {days} днів: {average_change:.2f} кг"
+        elif average_change < 0:
+            return f"Середнє зниження ваги за останні {days} днів: {abs(average_change):.2f} кг"
+        else:
+            return f"Вага залишилась незмінною за останні {days} днів."
+
+    def get_weekly_weight_difference(self):
+        today = datetime.now(kiev_timezone).date()
+        week_ago = today - timedelta(days=7)
+        weights = [Decimal(str(weight)) for weight in self.measurements.weights_since(week_ago)]
+
+        if len(weights) < 2:
+            return "Немає достатньо даних за останні 7 днів."
+
+        initial_weight = weights[0]
+        final_weight = weights[-1]
+        difference = final_weight - initial_weight
+
+        return f"{difference:.2f} кг"
+
+    def get_monthly_weight_difference(self):
+        today = datetime.now(kiev_timezone).date()
+        month_ago = today - timedelta(days=30)
+        weights = [Decimal(str(weight)) for weight in self.measurements.weights_since(month_ago)]
+
+        if len(weights) < 2:
+            return "Немає достатньо даних за останні 30 днів."
+
+        initial_weight = weights[0]
+        final_weight = weights[-1]
+        difference = final_weight - initial_weight
+
+        return f"{difference:.2f} кг"
+
+
+# Застосування запису журналу змін до словника користувачів
+def apply_record(users, record):
+    op, user_id, *args = record
+    if op == 'register':
+        gender, first_name, age, height, weight = args
+        users[user_id] = UserInfo(gender=gender, first_name=first_name, age=age, height=height, weight=weight)
+    elif op == 'measure':
+        date, age, height, weight = args
+        user_info = users[user_id]
+        user_info.age = age
+        user_info.height = height
+        user_info.weight = weight
+        user_info.add_measurement(age, height, weight, date)
+    elif op == 'rename':
+        users[user_id].first_name = args[0]
@@ -0,0 +1,184 @@
+import asyncio
+import queue
+import threading
+import time
+from collections import deque
+import telebot
+from decouple import config
+from metrics import TELEGRAM_SECONDS, TELEGRAM_ERRORS
+
+logger = telebot.logger
+
+# Обмеження Telegram: близько 30 повідомлень на секунду для бота
+# та не більше одного повідомлення на секунду в один чат (з невеликими сплесками)
+GLOBAL_RATE = config('OUTBOX_GLOBAL_RATE', default=30, cast=float)
+CHAT_RATE = 1
+CHAT_BURST = 3
+MAX_MESSAGE_LENGTH = 4096
+MAX_RETRIES = 3
+MAX_IDLE_BUCKETS = 10000
+
+
+# Відро токенів з резервуванням: повертає, скільки чекати до відправки
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        with self.lock:
+            self._refill()
+            self.tokens -= 1
+            return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def full(self):
+        with self.lock:
+            self._refill()
+            return self.tokens >= self.capacity
+
+
+# Наступне повідомлення з черги чату; текстові повідомлення, що йдуть поспіль,
+# склеюються в одне (клавіатура береться з останнього)
+def coalesce(pending):
+    method, args, kwargs = pending.popleft()
+    if method != 'send_message':
+        return method, args, kwargs
+    text = args[0]
+    while (pending and kwargs.get('reply_markup') is None and pending[0][0] == 'send_message'
+           and len(text) + 2 + len(pending[0][1][0]) <= MAX_MESSAGE_LENGTH):
+        _, next_args, kwargs = pending.popleft()
+        text = f"{text}\n\n{next_args[0]}"
+    return method, (text,), kwargs
+
+
+# Час очікування, який Telegram вимагає у відповіді 429, або None для інших помилок
+def retry_after(error):
+    if getattr(error, 'error_code', None) == 429:
+        return error.result_json.get('parameters', {}).get('retry_after', 1)
+    return None
+
+
+# Спільна частина черг: повідомлення кожного чату стоять у власній черзі,
+# а чати обробляються паралельно
+class BaseOutbox:
+    def __init__(self, bot):
+        self.bot = bot
+        self.global_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_RATE)
+        self.chats = {}  # chat_id -> черга повідомлень; наявність ключа означає, що чат обробляється
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def send_message(self, chat_id, text, reply_markup=None):
+        self._put(chat_id, ('send_message', (text,), {'reply_markup': reply_markup}))
+
+    def send_voice(self, chat_id, voice, caption=None):
+        self._put(chat_id, ('send_voice', (voice,), {'caption': caption}))
+
+    def broadcast(self, chat_ids, text):
+        for chat_id in chat_ids:
+            self.send_message(chat_id, text)
+
+    def _put(self, chat_id, message):
+        with self.lock:
+            pending = self.chats.get(chat_id)
+            if pending is not None:
+                pending.append(message)
+                return
+            self.chats[chat_id] = deque([message])
+            if len(self.buckets) > MAX_IDLE_BUCKETS:
+                self.buckets = {key: bucket for key, bucket in self.buckets.items() if not bucket.full()}
+        self._start(chat_id)
+
+    def _next(self, chat_id):
+        with self.lock:
+            pending = self.chats[chat_id]
+            if not pending:
+                del self.chats[chat_id]
+                return None
+            return coalesce(pending)
+
+    def _delay(self, chat_id):
+        bucket = self.buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.buckets.setdefault(chat_id, TokenBucket(CHAT_RATE, CHAT_BURST))
+        return max(bucket.reserve(), self.global_bucket.reserve())
+
+    def depth(self):
+        with self.lock:
+            return sum(len(pending) for pending in self.chats.values())
+
+
+# Черга для синхронного бота: повідомлення відправляють фонові потоки
+class Outbox(BaseOutbox):
+    def __init__(self, bot, workers=8):
+        super().__init__(bot)
+        self.ready = queue.Queue()
+        for _ in range(workers):
+            threading.Thread(target=self._worker, daemon=True).start()
+
+    def _start(self, chat_id):
+        self.ready.put(chat_id)
+
+    def _worker(self):
+        while True:
+            chat_id = self.ready.get()
+            while (message := self._next(chat_id)) is not None:
+                self._deliver(chat_id, *message)
+
+    def _deliver(self, chat_id, method, args, kwargs):
+        for attempt in range(MAX_RETRIES + 1):
+            time.sleep(self._delay(chat_id))
+            try:
+                with TELEGRAM_SECONDS.time(method=method):
+                    return getattr(self.bot, method)(chat_id, *args, **kwargs)
+            except Exception as error:
+                TELEGRAM_ERRORS.inc(method=method)
+                wait = retry_after(error)
+                if wait is None and hasattr(error, 'error_code'):
+                    logger.error("Telegram відхилив повідомлення в чат %s: %s", chat_id, error)
+                    return
+                if attempt == MAX_RETRIES:
+                    logger.exception("Не вдалось надіслати повідомлення в чат %s", chat_id)
+                    return
+                time.sleep(wait if wait is not None else 2 ** attempt)
+
+
+# Черга для асинхронного бота: для кожного чату з повідомленнями працює окрема задача
+class AsyncOutbox(BaseOutbox):
+    def __init__(self, bot):
+        super().__init__(bot)
+        self.tasks = set()
+
+    def _start(self, chat_id):
+        task = asyncio.create_task(self._drain(chat_id))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _drain(self, chat_id):
+        while (message := self._next(chat_id)) is not None:
+            await self._deliver(chat_id, *message)
+
+    async def _deliver(self, chat_id, method, args, kwargs):
+        for attempt in range(MAX_RETRIES + 1):
+            await asyncio.sleep(self._delay(chat_id))
+            try:
+                with TELEGRAM_SECONDS.time(method=method):
+                    return await getattr(self.bot, method)(chat_id, *args, **kwargs)
+            except Exception as error:
+                TELEGRAM_ERRORS.inc(method=method)
+                wait = retry_after(error)
+                if wait is None and hasattr(error, 'error_code'):
+                    logger.error("Telegram відхилив повідомлення в чат %s: %s", chat_id, error)
+                    return
+                if attempt == MAX_RETRIES:
+                    logger.exception("Не вдалось надіслати повідомлення в чат %s", chat_id)
+                    return
+                await asyncio.sleep(wait if wait is not None else 2 ** attempt)
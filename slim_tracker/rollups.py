@@ -0,0 +1,170 @@
+import threading
+import time
+from bisect import bisect_left
+import numpy as np
+import telebot
+from collections import namedtuple
+from datetime import date as date_type, datetime, time as time_type, timedelta
+from models import kiev_timezone
+from stats import ProfileStats, WINDOWS, MOVING_AVERAGE_DAYS, TREND_DAYS
+
+logger = telebot.logger
+
+# Ковзні вікна (днів до сьогодні), для яких зберігаються підсумки
+ROLLUP_WINDOWS = tuple(sorted(set(WINDOWS + (MOVING_AVERAGE_DAYS, TREND_DAYS))))
+
+# Підсумок замірів за період; bmi - за останньою вагою періоду, mean не округлюється,
+# щоб з неї можна було точно відновити суму
+Aggregate = namedtuple('Aggregate', ['first', 'last', 'min', 'max', 'mean', 'bmi', 'count'])
+
+# Підсумки користувача на день day без сьогоднішніх замірів:
+# windows - {днів: Aggregate або None},
+# trend_sums - суми (n, Σx, Σy, Σx², Σxy) для регресії за TREND_DAYS днів, x - день відносно day
+UserRollup = namedtuple('UserRollup', ['day', 'windows', 'trend_sums'])
+
+
+def _weight(value):
+    return round(float(value), 2) + 0.0
+
+
+def _aggregate(weights, heights):
+    if not len(weights):
+        return None
+    height = heights[-1]
+    bmi = _weight(weights[-1] / (height / 100) ** 2) if height == height and height > 0 else None
+    return Aggregate(_weight(weights[0]), _weight(weights[-1]), _weight(weights.min()), _weight(weights.max()),
+                     float(weights.mean()), bmi, len(weights))
+
+
+# Обчислення підсумків за один прохід по замірах найдовшого вікна, а не всього ряду.
+# Зрізи копіюють хвости масивів; якщо між зрізами паралельно додався замір,
+# зайвий елемент відкидається
+def compute_rollup(user_info, today):
+    series = user_info.measurements
+    day = today.toordinal()
+    start = bisect_left(series.days, day - ROLLUP_WINDOWS[-1])
+    days = np.frombuffer(series.days[start:], dtype=np.intc)
+    weights = np.frombuffer(series.weights[start:], dtype=np.float32)
+    heights = np.frombuffer(series.heights[start:], dtype=np.float32)
+    count = min(len(days), len(weights), len(heights))
+    days = days[:count]
+    weights = np.round(weights[:count].astype(np.float64), 2)
+    heights = heights[:count].astype(np.float64)
+    if user_info.height:
+        heights[np.isnan(heights)] = user_info.height
+
+    end = np.searchsorted(days, day)
+    starts = np.searchsorted(days, [day - days_count for days_count in ROLLUP_WINDOWS])
+    windows = {days_count: _aggregate(weights[start:end], heights[start:end])
+               for days_count, start in zip(ROLLUP_WINDOWS, starts)}
+
+    trend_start = starts[ROLLUP_WINDOWS.index(TREND_DAYS)]
+    x = (days[trend_start:end] - day).astype(np.float64)
+    y = weights[trend_start:end]
+    trend_sums = (len(x), x.sum(), y.sum(), (x * x).sum(), (x * y).sum())
+
+    return UserRollup(today, windows, trend_sums)
+
+
+# Статистика профілю з готових підсумків і сьогоднішнього заміру без проходу по всьому ряду
+def stats_from_rollup(rollup, measurements):
+    days, weights = measurements.arrays()
+    count = len(days)
+    day = rollup.day.toordinal()
+    today_weight = _weight(weights[-1]) if count and days[-1] == day else None
+    latest = _weight(weights[-1]) if count else None
+    windows = rollup.windows
+
+    yesterday = windows[1]
+    yesterday_weight = yesterday.last if yesterday is not None else None
+
+    differences = dict.fromkeys(WINDOWS)
+    for days_count in WINDOWS:
+        window = windows[days_count]
+        window_count = (window.count if window is not None else 0) + (today_weight is not None)
+        if window_count >= 2:
+            first = window.first if window is not None else today_weight
+            differences[days_count] = _weight(latest - first)
+
+    last_date = date_type.fromordinal(days[-1]) if count else None
+    last_difference = _weight(latest - _weight(weights[-2])) if count >= 2 else None
+
+    moving_average = None
+    average = windows[MOVING_AVERAGE_DAYS]
+    if average is not None or today_weight is not None:
+        # ваги мають не більше двох знаків після коми, тому суму можна відновити точно
+        total = round(average.mean * average.count, 2) if average is not None else 0.0
+        number = average.count if average is not None else 0
+        if today_weight is not None:
+            total += today_weight
+            number += 1
+        moving_average = _weight(total / number)
+
+    # Нахил лінійної регресії ваги за TREND_DAYS днів, кг на тиждень
+    trend = None
+    n, sum_x, sum_y, sum_xx, sum_xy = rollup.trend_sums
+    if today_weight is not None:
+        n, sum_y = n + 1, sum_y + today_weight
+    if n >= 2:
+        denominator = n * sum_xx - sum_x * sum_x
+        if denominator:
+            trend = _weight((n * sum_xy - sum_x * sum_y) / denominator * 7)
+
+    return ProfileStats(today_weight, yesterday_weight, last_date, last_difference, differences, moving_average, trend)
+
+
+# Сховище підсумків: user_id -> UserRollup. Підсумки тих, хто вже переглядав профіль,
+# перераховуються опівночі за Києвом, а решти - при першому зверненні
+class RollupStore:
+    def __init__(self):
+        self.rollups = {}
+        self.lock = threading.Lock()
+
+    def get(self, user_id, user_info, today=None):
+        if today is None:
+            today = datetime.now(kiev_timezone).date()
+        rollup = self.rollups.get(user_id)
+        if rollup is None or rollup.day != today:
+            rollup = compute_rollup(user_info, today)
+            with self.lock:
+                self.rollups[user_id] = rollup
+        return rollup
+
+    def stats(self, user_id, user_info, today=None):
+        return stats_from_rollup(self.get(user_id, user_info, today), user_info.measurements)
+
+    # Сьогоднішні заміри в підсумки не входять, тому скидати їх треба лише при зміні минулих днів
+    def apply(self, record):
+        op, user_id, *args = record
+        if op == 'measure' and args[0] != datetime.now(kiev_timezone).date():
+            with self.lock:
+                self.rollups.pop(user_id, None)
+
+    # Перерахунок для користувачів у пам'яті, що мають підсумки; решта відкидаються
+    def refresh(self, users, today=None):
+        if today is None:
+            today = datetime.now(kiev_timezone).date()
+        with self.lock:
+            active = set(self.rollups)
+        rollups = {user_id: compute_rollup(user_info, today) for user_id, user_info in users if user_id in active}
+        with self.lock:
+            self.rollups = rollups
+
+    def __len__(self):
+        return len(self.rollups)
+
+
+# Фоновий потік, що виконує job щодня опівночі за Києвом
+def schedule_midnight(job):
+    def run():
+        while True:
+            now = datetime.now(kiev_timezone)
+            midnight = kiev_timezone.localize(datetime.combine(now.date() + timedelta(days=1), time_type.min))
+            time.sleep(max((midnight - now).total_seconds(), 0) + 1)
+            try:
+                job()
+            except Exception:
+                logger.exception("Помилка нічного перерахунку")
+    thread = threading.Thread(target=run, daemon=True, name='midnight')
+    thread.start()
+    return thread
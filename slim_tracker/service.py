@@ -0,0 +1,235 @@
+import threading
+from decouple import config
+from datetime import datetime, timedelta
+from models import kiev_timezone
+from storage import UserRepository, PickleStorage, SQLiteStorage, DATA_FILE, JOURNAL_FILE, DB_FILE
+from leaderboard import Leaderboard, WINDOW_DAYS
+from stats import MOVING_AVERAGE_DAYS, TREND_DAYS, population_stats
+from rollups import RollupStore
+from cache import LRUCache
+from metrics import STORAGE_SECONDS, RENDER_SECONDS
+
+
+ADMIN_IDS = config('TG_CHAT_ADMIN').split(',')
+STORAGE_BACKEND = config('STORAGE_BACKEND', default='pickle')
+PROFILE_CACHE_SIZE = config('PROFILE_CACHE_SIZE', default=10000, cast=int)
+# Скільки користувачів SQLite-сховище тримає в пам'яті одночасно
+USER_CACHE_SIZE = config('USER_CACHE_SIZE', default=5000, cast=int)
+# Скільки перших місць показує таблиця результатів; весь список не вміщується в одне повідомлення
+TOP_USERS_LIMIT = config('TOP_USERS_LIMIT', default=10, cast=int)
+
+user_data = UserRepository()
+storage = None
+leaderboard = Leaderboard(TOP_USERS_LIMIT)
+# Підсумки замірів за ковзні вікна, що перераховуються опівночі
+rollups = RollupStore()
+# Обробники різних користувачів виконуються паралельно, тому зміни даних серіалізуються
+data_lock = threading.Lock()
+
+# Готові тексти відповідей: профіль - user_id -> (день, текст), таблиця - (версія, день, текст)
+profile_cache = LRUCache(PROFILE_CACHE_SIZE)
+top_users_cache = None
+data_version = 0  # кількість збережених змін; захищає кеш від запису застарілого тексту
+leaderboard_changes = None  # записи, збережені під час перебудови таблиці результатів
+
+
+# Збереження зміни: сховище застосовує запис до даних у пам'яті та зберігає його
+def save_data(*record):
+    global data_version
+    with data_lock:
+        data_version += 1
+        with STORAGE_SECONDS.time(operation='append'):
+            storage.append(record)
+        name = user_data[record[1]].first_name
+        leaderboard.apply(record, name)
+        if leaderboard_changes is not None:
+            leaderboard_changes.append((record, name))
+        rollups.apply(record)
+        profile_cache.discard(record[1])
+
+# Відновлення даних з обраного сховища
+def load_data():
+    global storage
+    if STORAGE_BACKEND == 'sqlite':
+        storage = SQLiteStorage(DB_FILE, USER_CACHE_SIZE)
+    else:
+        storage = PickleStorage(DATA_FILE, JOURNAL_FILE, data_lock)
+    with STORAGE_SECONDS.time(operation='load'):
+        storage.load(user_data)
+    build_leaderboard()
+
+# Таблиця результатів із замірів за останні WINDOW_DAYS днів у сховищі. Сховище читається
+# без data_lock, щоб не зупиняти збереження; записи, збережені за цей час, застосовуються
+# до нової таблиці перед підміною (повторно застосований замір нічого не змінює)
+def build_leaderboard():
+    global leaderboard_changes
+    week_ago = datetime.now(kiev_timezone).date() - timedelta(days=WINDOW_DAYS)
+    with data_lock:
+        leaderboard_changes = []
+    try:
+        # Імена читаються після замірів: у них є кожен, чий замір уже прочитано, зокрема з іншого процесу
+        with STORAGE_SECONDS.time(operation='measurements_since'):
+            recent_measurements = storage.measurements_since(week_ago)
+            names = storage.names_since(week_ago)
+        rebuilt = Leaderboard(TOP_USERS_LIMIT)
+        rebuilt.build(names, recent_measurements)
+        with data_lock:
+            for record, name in leaderboard_changes:
+                rebuilt.apply(record, name)
+            leaderboard.replace(rebuilt)
+    finally:
+        with data_lock:
+            leaderboard_changes = None
+
+# Нічне завдання: підсумки за новий день для користувачів у пам'яті та зсув вікна таблиці результатів
+def refresh_rollups():
+    today = datetime.now(kiev_timezone).date()
+    with STORAGE_SECONDS.time(operation='rollups'):
+        rollups.refresh(user_data.items(), today)
+    leaderboard.rollover()
+
+def close_data():
+    storage.close()
+
+# Функція для перевірки, чи є користувач адміністратором
+def is_admin(user_id):
+    return str(user_id) in ADMIN_IDS
+
+
+def calculate_top_users():
+    return leaderboard.top()
+
+
+WINDOW_LABELS = {
+    1: "останню добу",
+    7: "останні 7 днів",
+    30: "останні 30 днів",
+    90: "останні 90 днів",
+}
+
+# Формування тексту профілю з результату статистики
+def render_profile(user_info, stats):
+    health_status = user_info.get_health_status()
+
+    last_measurements = ""
+    if stats.today_weight is not None:
+        last_measurements += f"Сьогодні: Вага {stats.today_weight} кг\n"
+    else:
+        last_measurements += "Сьогодні: Немає даних\n"
+    if stats.yesterday_weight is not None:
+        last_measurements += f"Вчора: Вага {stats.yesterday_weight} кг\n"
+    else:
+        last_measurements += "Вчора: Немає даних\n"
+    if stats.today_weight is None and stats.yesterday_weight is None and stats.last_date:
+        last_measurements += f"Останній замір: {stats.last_date.day}.{stats.last_date.month}\n"
+
+    if stats.last_difference is not None:
+        weight_difference = f"{stats.last_difference:.2f} кг"
+    else:
+        weight_difference = "Немає достатньо даних для обчислення різниці."
+
+    window_differences = ""
+    for days, difference in stats.differences.items():
+        label = WINDOW_LABELS[days]
+        if difference is not None:
+            window_differences += f"Різниця ваги за {label}: {difference:.2f} кг\n"
+        else:
+            window_differences += f"Різниця ваги за {label}: Немає достатньо даних за {label}.\n"
+
+    trends = ""
+    if stats.moving_average is not None:
+        trends += f"Середня вага за останні {MOVING_AVERAGE_DAYS} днів: {stats.moving_average:.2f} кг\n"
+    if stats.trend is not None:
+        trends += f"Тренд за останні {TREND_DAYS} днів: {stats.trend:+.2f} кг на тиждень\n"
+
+    return (f"Ім'я: {user_info.first_name}\n"
+            f"Стать: {user_info.gender.capitalize()}\n"
+            f"Вік: {user_info.age}\n"
+            f"Зріст: {user_info.height} см\n"
+            f"Вага: {user_info.weight} кг\n"
+            f"{health_status}\n\n"
+            f"Останні заміри:\n{last_measurements}\n"
+            f"Різниця ваги між останнім і передостаннім заміром: {weight_difference}\n\n"
+            f"{window_differences}"
+            f"{trends}").rstrip()
+
+
+# Формування тексту таблиці найкращих результатів
+def render_top_users():
+    top_users = calculate_top_users()
+    if not top_users:
+        return "Немає достатньо даних для відображення найкращих результатів."
+
+    response = "Найкращі результати за останній тиждень:\n\n"
+    for i, (name, weight_change, status) in enumerate(top_users, start=1):
+        response += f"{i}. {name} - {status} {abs(weight_change):.2f} % \n"
+    return response
+
+
+# Профіль з кешу; запис застаріває зі зміною дня за Києвом або при зміні даних користувача
+def profile_response(user_id):
+    today = datetime.now(kiev_timezone).date()
+    cached = profile_cache.get(user_id)
+    if cached is not None and cached[0] == today:
+        return cached[1]
+    version = data_version
+    with RENDER_SECONDS.time(view='profile'):
+        user_info = user_data[user_id]
+        response = render_profile(user_info, rollups.stats(user_id, user_info, today))
+    if version == data_version:
+        profile_cache.put(user_id, (today, response))
+    return response
+
+
+# Таблиця результатів рахується один раз на версію даних і спільна для всіх
+def top_users_response():
+    global top_users_cache
+    today = datetime.now(kiev_timezone).date()
+    cached = top_users_cache
+    if cached is not None and cached[:2] == (leaderboard.version, today):
+        return cached[2]
+    version = leaderboard.version
+    with RENDER_SECONDS.time(view='top'):
+        response = render_top_users()
+    top_users_cache = (version, today, response)
+    return response
+
+
+def _share(count, total):
+    return f"{count} ({count / total:.1%})"
+
+# Зведення по всіх користувачах для адміністраторів
+def render_population():
+    stats = population_stats(*storage.profile_arrays())
+    if stats is None:
+        return "Немає даних користувачів."
+
+    total = stats.users
+    response = (f"Користувачів: {total}\n"
+                f"Середній ІМТ: {stats.mean_bmi:.2f}, медіана: {stats.median_bmi:.2f}\n"
+                f"В межах оптимальної ваги: {_share(stats.in_optimal_range, total)}\n"
+                f"Вище оптимальної ваги: {_share(stats.above_optimal_range, total)}")
+    if stats.mean_excess_weight is not None:
+        response += f", в середньому на {stats.mean_excess_weight:.2f} кг"
+
+    response += "\n\nСтатуси:\n"
+    for status, count in stats.statuses.items():
+        response += f"{status}: {_share(count, total)}\n"
+
+    response += "\nРозподіл ІМТ:\n"
+    largest = max(count for _, _, count in stats.histogram) or 1
+    for low, high, count in stats.histogram:
+        if low is None:
+            label = f"< {high:.1f}"
+        elif high is None:
+            label = f"≥ {low:.1f}"
+        else:
+            label = f"{low:.1f}-{high:.1f}"
+        bar = '█' * max(round(count / largest * 20), 1) + ' ' if count else ''
+        response += f"{label}: {bar}{count}\n"
+    return response.rstrip()
+
+
+def population_response():
+    with RENDER_SECONDS.time(view='population'):
+        return render_population()
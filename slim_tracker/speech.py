@@ -0,0 +1,147 @@
+import io
+import json
+import threading
+import time
+import telebot
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from decouple import config
+from metrics import SPEECH_SECONDS
+
+logger = telebot.logger
+
+# Розпізнавачу достатньо 16 кГц моно
+SAMPLE_RATE = 16000
+
+# Порядок спроб розпізнавання, наприклад "vosk,google"
+SPEECH_BACKENDS = config('SPEECH_BACKENDS', default='google').split(',')
+VOSK_MODEL_PATH = config('VOSK_MODEL_PATH', default='model')
+SPEECH_WORKERS = config('SPEECH_WORKERS', default=2, cast=int)
+# Загальний бюджет часу на одне голосове повідомлення, секунди
+SPEECH_TIMEOUT = config('SPEECH_TIMEOUT', default=15.0, cast=float)
+
+
+# pydub і speech_recognition імпортуються лише під час ініціалізації голосової підсистеми,
+# щоб старт бота (і перезапуск після падіння) не чекав на аудіостек, потрібний рідко
+AudioSegment = None
+sr = None
+
+
+# Онлайн-розпізнавання через Google Speech API
+class GoogleRecognizer:
+    def __init__(self, language="uk-UA"):
+        self.language = language
+
+    # Без operation_timeout urlopen чекає на мережу необмежено довго і займає потік пулу
+    def recognize(self, audio_data, timeout=None):
+        recognizer = sr.Recognizer()
+        recognizer.operation_timeout = timeout
+        return recognizer.recognize_google(audio_data, language=self.language)
+
+
+# Офлайн-розпізнавання через Vosk: модель завантажується один раз і спільна для всіх потоків
+class VoskRecognizer:
+    def __init__(self, model_path=VOSK_MODEL_PATH):
+        import vosk
+        vosk.SetLogLevel(-1)
+        self.vosk = vosk
+        self.model = vosk.Model(model_path)
+
+    def recognize(self, audio_data, timeout=None):
+        recognizer = self.vosk.KaldiRecognizer(self.model, audio_data.sample_rate)
+        recognizer.AcceptWaveform(audio_data.frame_data)
+        text = json.loads(recognizer.FinalResult()).get('text')
+        if not text:
+            raise sr.UnknownValueError()
+        return text
+
+
+BACKENDS = {
+    'google': GoogleRecognizer,
+    'vosk': VoskRecognizer,
+}
+
+recognizers = None
+pool = None
+init_lock = threading.Lock()
+
+
+# Імпорт аудіостеку та завантаження моделей; повторні виклики нічого не роблять.
+# Якщо аудіостек не імпортується, розпізнавання вимикається (pool залишається None)
+def init_speech(backends=SPEECH_BACKENDS):
+    global recognizers, pool, AudioSegment, sr
+    with init_lock:
+        if recognizers is not None:
+            return
+        try:
+            from pydub import AudioSegment
+            import speech_recognition as sr
+        except Exception:
+            logger.exception("Аудіостек недоступний, голосові повідомлення не розпізнаватимуться")
+            recognizers = []
+            return
+        loaded = []
+        for name in backends:
+            try:
+                loaded.append((name, BACKENDS[name]()))
+            except Exception:
+                logger.exception("Не вдалось ініціалізувати розпізнавач %s", name)
+        pool = ThreadPoolExecutor(max_workers=SPEECH_WORKERS, thread_name_prefix='speech')
+        recognizers = loaded
+
+
+# Ініціалізація у фоні після старту: бот уже обробляє текстові повідомлення,
+# а перше голосове, якщо прийде раніше, дочекається її в recognize_speech
+def warm_up_speech():
+    threading.Thread(target=init_speech, daemon=True, name='speech-warm-up').start()
+
+
+# Декодування OGG/Opus з пам'яті в PCM без тимчасових файлів:
+# ffmpeg отримує дані через stdin і повертає WAV через stdout
+def decode_voice(data, sample_rate=SAMPLE_RATE):
+    audio = AudioSegment.from_file(io.BytesIO(data), format="ogg", codec="opus")
+    audio = audio.set_channels(1).set_sample_width(2)
+    if sample_rate and audio.frame_rate > sample_rate:
+        audio = audio.set_frame_rate(sample_rate)
+    return sr.AudioData(audio.raw_data, audio.frame_rate, audio.sample_width)
+
+
+# Виконується в пулі, тому вимірюється сама робота без очікування в черзі
+def _timed(stage, function, *args):
+    with SPEECH_SECONDS.time(stage=stage):
+        return function(*args)
+
+
+# Результат задачі пулу; якщо час вичерпано, задача скасовується, щоб не займати потік
+def _wait(future, timeout):
+    try:
+        return future.result(timeout=timeout)
+    except TimeoutError:
+        future.cancel()
+        raise
+
+
+# Функція для конвертації голосового повідомлення в текст.
+# Розпізнавачі пробуються по черзі; кожен отримує рівну частку залишку бюджету часу,
+# тож якщо перший зависне, наступні все одно встигнуть спрацювати
+def recognize_speech(data, timeout=SPEECH_TIMEOUT):
+    if recognizers is None:
+        init_speech()
+    if pool is None:
+        return False
+    deadline = time.monotonic() + timeout
+    try:
+        audio_data = _wait(pool.submit(_timed, 'decode', decode_voice, data), timeout)
+    except TimeoutError:
+        return False
+    for i, (name, recognizer) in enumerate(recognizers):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        share = remaining / (len(recognizers) - i)
+        try:
+            return _wait(pool.submit(_timed, f'recognize_{name}', recognizer.recognize, audio_data, share), share)
+        except (sr.UnknownValueError, sr.RequestError, TimeoutError):
+            continue
+        except Exception:
+            logger.exception("Помилка розпізнавача %s", name)
+    return False
@@ -0,0 +1,97 @@
+import numpy as np
+from collections import namedtuple
+
+WINDOWS = (1, 7, 30, 90)
+MOVING_AVERAGE_DAYS = 7
+TREND_DAYS = 30
+
+# Статистика профілю користувача (rollups.stats_from_rollup).
+# differences - словник {кількість днів: різниця ваги або None, якщо замало даних}
+ProfileStats = namedtuple('ProfileStats', [
+    'today_weight',
+    'yesterday_weight',
+    'last_date',
+    'last_difference',
+    'differences',
+    'moving_average',
+    'trend',
+])
+
+
+def _weight(value):
+    # Округлення прибирає похибку float та "-0.00"
+    return round(float(value), 2) + 0.0
+
+
+# Класифікація всіх користувачів одразу: масиви замість перебору об'єктів UserInfo
+
+# Межі ІМТ дорослих і відповідні статуси
+BMI_EDGES = np.array([18.5, 25.0, 30.0, 35.0, 40.0])
+BMI_STATUSES = (
+    "Недостатня вага",
+    "Нормальна вага",
+    "Надмірна вага",
+    "Ожиріння 1 ступеня (легке)",
+    "Ожиріння 2 ступеня (помірне)",
+    "Ожиріння 3 ступеня (важке)",
+)
+CHILD_STATUS = "Діти та підлітки"
+
+# Вікові групи: до 6, 6-11, 12-17 років і дорослі; оптимальний ІМТ для [чоловіки, жінки] за групами
+AGE_EDGES = np.array([6, 12, 18])
+OPTIMAL_MIN_BMI = np.array([[14.0, 16.0, 17.0, 18.5], [13.5, 15.5, 16.5, 18.5]])
+OPTIMAL_MAX_BMI = np.array([[19.0, 22.0, 23.0, 24.9], [18.5, 21.5, 22.5, 24.9]])
+
+HISTOGRAM_EDGES = np.arange(15.0, 47.5, 2.5)
+
+# statuses - {статус: кількість}; histogram - [(від, до, кількість)], крайні кошики відкриті
+PopulationStats = namedtuple('PopulationStats', [
+    'users',
+    'mean_bmi',
+    'median_bmi',
+    'statuses',
+    'in_optimal_range',
+    'above_optimal_range',
+    'mean_excess_weight',
+    'histogram',
+])
+
+
+# male - булевий масив статі, решта - числові масиви однакової довжини
+def population_stats(male, ages, heights, weights):
+    valid = (heights > 0) & (weights > 0) & ~np.isnan(ages)
+    male, ages, heights, weights = male[valid], ages[valid], heights[valid] / 100, weights[valid]
+    if not len(weights):
+        return None
+
+    squared_heights = heights * heights
+    bmi = weights / squared_heights
+    age_bands = np.searchsorted(AGE_EDGES, ages, side='right')
+    genders = np.where(male, 0, 1)
+    min_weights = OPTIMAL_MIN_BMI[genders, age_bands] * squared_heights
+    max_weights = OPTIMAL_MAX_BMI[genders, age_bands] * squared_heights
+
+    adults = age_bands == len(AGE_EDGES)
+    categories = np.searchsorted(BMI_EDGES, bmi[adults], side='right')
+    counts = np.bincount(categories, minlength=len(BMI_STATUSES))
+    statuses = dict(zip(BMI_STATUSES, counts.tolist()))
+    statuses[CHILD_STATUS] = int((~adults).sum())
+
+    above = weights > max_weights
+    excess = weights[above] - max_weights[above]
+
+    bins = np.searchsorted(HISTOGRAM_EDGES, bmi, side='right')
+    histogram_counts = np.bincount(bins, minlength=len(HISTOGRAM_EDGES) + 1)
+    bounds = [None] + HISTOGRAM_EDGES.tolist() + [None]
+    histogram = [(bounds[i], bounds[i + 1], int(count)) for i, count in enumerate(histogram_counts)]
+
+    return PopulationStats(
+        users=len(weights),
+        mean_bmi=_weight(bmi.mean()),
+        median_bmi=_weight(np.median(bmi)),
+        statuses=statuses,
+        in_optimal_range=int(((weights >= min_weights) & ~above).sum()),
+        above_optimal_range=int(above.sum()),
+        mean_excess_weight=_weight(excess.mean()) if len(excess) else None,
+        histogram=histogram,
+    )
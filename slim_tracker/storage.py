@@ -0,0 +1,452 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import date as date_type
+import numpy as np
+import telebot
+from models import UserInfo, apply_record
+from cache import LRUCache
+from metrics import STORAGE_SECONDS
+
+logger = telebot.logger
+
+# Файли даних у робочому каталозі бота; спільні для бота і transfer.py
+DATA_FILE = "user_data.pickle"
+JOURNAL_FILE = "user_data.journal"
+DB_FILE = "user_data.sqlite3"
+# Скільки користувачів копіюється для знімка за одне захоплення замка даних
+SNAPSHOT_CHUNK = 100
+
+
+# os.replace і ротація журналу створюють новий inode, тому за ним видно підміну файлу
+def _inode(path):
+    try:
+        return os.stat(path).st_ino
+    except FileNotFoundError:
+        return None
+
+# Журнал змін: кожна зміна даних дописується в кінець файлу одним записом,
+# а повний знімок перезаписується лише під час фонової компактизації.
+# Компактизація починається, коли журнал досяг частки compact_ratio від розміру останнього
+# знімка (але не менше compact_bytes): знімок переписується тим рідше, чим більше даних,
+# тому на один запис припадає сталий обсяг роботи
+class Journal:
+    def __init__(self, path, snapshot_path, snapshot, fsync_every=32, fsync_interval=1.0, compact_bytes=1024 * 1024,
+                 compact_ratio=0.5):
+        self.path = path
+        self.old_path = path + '.old'
+        self.snapshot_path = snapshot_path
+        self.snapshot = snapshot  # функція, що записує знімок у відкритий файл
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.compact_bytes = compact_bytes
+        self.compact_ratio = compact_ratio
+        self.snapshot_size = 0
+        self.lock = threading.Lock()
+        self.file = None
+        self.pending = 0
+        self.compacting = False
+        self.closed = False
+
+    def load(self, apply):
+        if os.path.exists(self.snapshot_path):
+            self.snapshot_size = os.path.getsize(self.snapshot_path)
+        # Якщо попередня компактизація обірвалась, старий журнал ще не увійшов у знімок
+        interrupted = os.path.exists(self.old_path)
+        if interrupted:
+            self._replay(self.old_path, apply)
+        self._replay(self.path, apply)
+        if interrupted:
+            self._write_snapshot()
+            os.remove(self.old_path)
+
+        self.file = open(self.path, 'ab')
+        threading.Thread(target=self._flush_loop, daemon=True).start()
+
+    # Читання без жодних змін файлів (експорт поруч із працюючим ботом):
+    # журнал не відкривається на запис, хвіст не обрізається, знімок не перезаписується
+    def replay(self, apply):
+        self._replay(self.old_path, apply, truncate=False)
+        self._replay(self.path, apply, truncate=False)
+
+    def _replay(self, path, apply, truncate=True):
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb') as file:
+            good_offset = 0
+            while True:
+                try:
+                    record = pickle.load(file)
+                except EOFError:
+                    break
+                except Exception:
+                    # Обрізаний запис після аварійної зупинки - відкидаємо хвіст
+                    break
+                apply(record)
+                good_offset = file.tell()
+        if truncate and good_offset != os.path.getsize(path):
+            os.truncate(path, good_offset)
+
+    def append(self, record):
+        with self.lock:
+            pickle.dump(record, self.file)
+            self.file.flush()
+            self.pending += 1
+            if self.pending >= self.fsync_every:
+                self._fsync()
+            threshold = max(self.compact_bytes, self.snapshot_size * self.compact_ratio)
+            start_compaction = not self.compacting and self.file.tell() >= threshold
+            if start_compaction:
+                self.compacting = True
+        if start_compaction:
+            threading.Thread(target=self._compact, daemon=True).start()
+
+    def _fsync(self):
+        if self.pending:
+            os.fsync(self.file.fileno())
+            self.pending = 0
+
+    def _flush_loop(self):
+        # Пакетний fsync: записи, що накопичились між викликами, скидаються на диск разом
+        while not self.closed:
+            time.sleep(self.fsync_interval)
+            with self.lock:
+                if not self.closed:
+                    self._fsync()
+
+    def _compact(self):
+        try:
+            with self.lock:
+                if self.closed:
+                    return
+                self._fsync()
+                # Залишений .old означає, що попередній знімок не вдався і його записи ще не в знімку:
+                # журнал не ротується, а знімок просто знімається ще раз
+                if not os.path.exists(self.old_path):
+                    self.file.close()
+                    os.replace(self.path, self.old_path)
+                    self.file = open(self.path, 'ab')
+            # Знімок береться вже після ротації, тому містить усе з .old; записи, що потрапили
+            # і в знімок, і в новий журнал, просто застосуються повторно
+            self._write_snapshot()
+            os.remove(self.old_path)
+        except Exception:
+            logger.exception("Не вдалось записати знімок %s", self.snapshot_path)
+        finally:
+            self.compacting = False
+
+    def _write_snapshot(self):
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'wb') as file:
+            self.snapshot(file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        self.snapshot_size = os.path.getsize(self.snapshot_path)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            if self.file is not None:
+                self._fsync()
+                self.file.close()
+
+
+# Користувачі за user_id. Якщо задано завантажувач, у пам'яті тримається лише гаряча
+# частина (не більше size найдавніше використаних витісняються), а решта підвантажується
+# зі сховища при першому зверненні. Сховище записує зміни одразу, тому витіснення нічого не пише.
+# Незареєстровані user_id теж запам'ятовуються, щоб їхні повідомлення не йшли щоразу в сховище
+class UserRepository:
+    def __init__(self):
+        self.users = OrderedDict()
+        self.lock = threading.Lock()
+        self.size = None
+        self.load_user = None
+        self.missing = None
+
+    def configure(self, size, load_user):
+        self.size = size
+        self.load_user = load_user
+        self.missing = LRUCache(size)
+
+    def get(self, user_id, default=None):
+        with self.lock:
+            user_info = self.users.get(user_id)
+            if user_info is not None:
+                self.users.move_to_end(user_id)
+                return user_info
+        if self.load_user is None or self.missing.get(user_id):
+            return default
+        with STORAGE_SECONDS.time(operation='load_user'):
+            user_info = self.load_user(user_id)
+        if user_info is None:
+            # Під замком: реєстрація в іншому потоці або вже видна тут, або скине позначку пізніше
+            with self.lock:
+                if user_id not in self.users:
+                    self.missing.put(user_id, True)
+            return default
+        return self._add(user_id, user_info, replace=False)
+
+    # Якщо інший потік встиг завантажити того ж користувача, залишається перший екземпляр
+    def _add(self, user_id, user_info, replace):
+        with self.lock:
+            if not replace and user_id in self.users:
+                user_info = self.users[user_id]
+            else:
+                self.users[user_id] = user_info
+                if self.missing is not None:
+                    self.missing.discard(user_id)
+            self.users.move_to_end(user_id)
+            while self.size is not None and len(self.users) > self.size:
+                self.users.popitem(last=False)
+        return user_info
+
+    def __getitem__(self, user_id):
+        user_info = self.get(user_id)
+        if user_info is None:
+            raise KeyError(user_id)
+        return user_info
+
+    def __setitem__(self, user_id, user_info):
+        self._add(user_id, user_info, replace=True)
+
+    def __contains__(self, user_id):
+        return self.get(user_id) is not None
+
+    def __len__(self):
+        return len(self.users)
+
+    def update(self, users):
+        for user_id, user_info in users.items():
+            self[user_id] = user_info
+
+    # Користувачі, що зараз у пам'яті
+    def items(self):
+        with self.lock:
+            return list(self.users.items())
+
+
+# Профілі всіх користувачів колонками (стать, вік, зріст, вага) для зведеної статистики.
+# Оновлюються з кожним записом, тому статистика не перебирає об'єкти UserInfo
+class ProfileColumns:
+    def __init__(self, capacity=1024):
+        self.rows = {}  # user_id -> номер рядка
+        self.male = np.zeros(capacity, dtype=bool)
+        self.values = np.full((3, capacity), np.nan)
+        self.lock = threading.Lock()
+
+    def set(self, user_id, user_info):
+        values = [np.nan if value is None else value for value in (user_info.age, user_info.height, user_info.weight)]
+        with self.lock:
+            row = self.rows.get(user_id)
+            if row is None:
+                row = self.rows[user_id] = len(self.rows)
+                if row == len(self.male):
+                    grow = max(row, 1024)
+                    self.male = np.concatenate((self.male, np.zeros(grow, dtype=bool)))
+                    self.values = np.concatenate((self.values, np.full((3, grow), np.nan)), axis=1)
+            self.male[row] = user_info.gender == '👨'
+            self.values[:, row] = values
+
+    # Заповнення для всіх користувачів одразу після завантаження
+    def fill(self, users):
+        with self.lock:
+            self.rows = {user_id: row for row, (user_id, _) in enumerate(users)}
+            self.male = np.array([user_info.gender == '👨' for _, user_info in users], dtype=bool)
+            self.values = np.array([[getattr(user_info, name) for _, user_info in users]
+                                    for name in ('age', 'height', 'weight')], dtype=float).reshape(3, len(users))
+
+    def arrays(self):
+        with self.lock:
+            count = len(self.rows)
+            return self.male[:count].copy(), *self.values[:, :count].copy()
+
+
+# Сховище на основі pickle-знімка та журналу змін; всі дані тримаються в пам'яті.
+# lock - замок, під яким змінюються дані (service.data_lock)
+class PickleStorage:
+    def __init__(self, data_file, journal_file, lock=None):
+        self.data_file = data_file
+        self.lock = lock if lock is not None else threading.Lock()
+        self.users = UserRepository()
+        self.profiles = ProfileColumns()
+        self.journal = Journal(journal_file, data_file, snapshot=self._snapshot)
+
+    # Під замком даних користувачі лише копіюються, частинами по SNAPSHOT_CHUNK, а серіалізуються
+    # вже без нього, тому обробники не чекають на весь знімок. Журнал ротовано до початку копіювання:
+    # зміни, зроблені між копіюванням частин, є в новому журналі і застосуються поверх знімка
+    def _snapshot(self, file):
+        users = self.users.items()
+        copies = {}
+        for start in range(0, len(users), SNAPSHOT_CHUNK):
+            with self.lock:
+                for user_id, user_info in users[start:start + SNAPSHOT_CHUNK]:
+                    copies[user_id] = user_info.copy()
+        pickle.dump(copies, file)
+
+    def load(self, users):
+        self.users = users
+        if os.path.exists(self.data_file):
+            with open(self.data_file, 'rb') as file:
+                self.users.update(pickle.load(file))
+        self.journal.load(lambda record: apply_record(self.users, record))
+        self.profiles.fill(self.users.items())
+
+    # Копія даних без змін файлів. Якщо бот тим часом ротував журнал чи переписав знімок,
+    # прочитані частини могли розійтись, тому читання повторюється
+    def read(self):
+        while True:
+            files = _inode(self.data_file), _inode(self.journal.path)
+            users = UserRepository()
+            try:
+                if files[0] is not None:
+                    with open(self.data_file, 'rb') as file:
+                        users.update(pickle.load(file))
+                self.journal.replay(lambda record: apply_record(users, record))
+            except FileNotFoundError:
+                continue
+            if (_inode(self.data_file), _inode(self.journal.path)) == files:
+                return users
+
+    def append(self, record):
+        apply_record(self.users, record)
+        self.journal.append(record)
+        if record[0] != 'rename':
+            self.profiles.set(record[1], self.users[record[1]])
+
+    # Пари (дата, вага) кожного користувача з указаної дати, впорядковані за датою
+    def measurements_since(self, date):
+        result = {}
+        for user_id, user_info in self.users.items():
+            series = user_info.measurements
+            start = bisect_left(series.days, date.toordinal())
+            measurements = [(date_type.fromordinal(series.days[i]), round(series.weights[i], 2))
+                            for i in range(start, len(series.days))]
+            if measurements:
+                result[user_id] = measurements
+        return result
+
+    # Стать (True - чоловік), вік, зріст і вага всіх користувачів масивами; None стає nan
+    def profile_arrays(self):
+        return self.profiles.arrays()
+
+    # Імена користувачів, що мають заміри з указаної дати
+    def names_since(self, date):
+        day = date.toordinal()
+        return {user_id: user_info.first_name for user_id, user_info in self.users.items()
+                if user_info.measurements.days and user_info.measurements.days[-1] >= day}
+
+    def close(self):
+        self.journal.close()
+
+
+# Сховище на основі SQLite: у пам'яті лише гаряча частина користувачів (USER_CACHE_SIZE),
+# решта завантажується за user_id при першому зверненні
+class SQLiteStorage:
+    def __init__(self, path, cache_size):
+        # timeout: базу можуть одночасно писати кілька процесів (cluster.py)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.cache_size = cache_size
+        self.users = UserRepository()
+        with self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY,
+                gender TEXT,
+                first_name TEXT,
+                age INTEGER,
+                height REAL,
+                weight REAL)""")
+            # Дата зберігається як порядковий номер дня (date.toordinal())
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS measurements (
+                user_id INTEGER,
+                date INTEGER,
+                age INTEGER,
+                height REAL,
+                weight REAL,
+                PRIMARY KEY (user_id, date)) WITHOUT ROWID""")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS measurements_date ON measurements (date)")
+        # Запити по всій таблиці (таблиця результатів, зведена статистика) йдуть окремим з'єднанням:
+        # у режимі WAL читання не блокує запис, і збереження не чекають на них
+        self.reader = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.read_lock = threading.Lock()
+
+    def load(self, users):
+        self.users = users
+        self.users.configure(self.cache_size, self.load_user)
+
+    # Профіль разом з усіма замірами
+    def load_user(self, user_id):
+        with self.lock:
+            profile = self.conn.execute("SELECT gender, first_name, age, height, weight FROM users WHERE user_id = ?",
+                                        (user_id,)).fetchone()
+            if profile is None:
+                return None
+            rows = self.conn.execute("SELECT date, age, height, weight FROM measurements WHERE user_id = ? ORDER BY date",
+                                     (user_id,)).fetchall()
+        user_info = UserInfo(*profile)
+        for date, age, height, weight in rows:
+            user_info.measurements.upsert(date_type.fromordinal(date), age, height, weight)
+        return user_info
+
+    def query(self, sql, params=()):
+        with self.read_lock:
+            return self.reader.execute(sql, params).fetchall()
+
+    # Замір і профіль у таблиці users записуються однією транзакцією: таблиця завжди актуальна,
+    # зокрема для інших процесів (cluster.py) і зведеної статистики
+    def append(self, record):
+        op, user_id, *args = record
+        with self.lock, self.conn:
+            if op == 'register':
+                gender, first_name, age, height, weight = args
+                self.conn.execute("INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?, ?, ?)",
+                                  (user_id, gender, first_name, age, height, weight))
+            elif op == 'measure':
+                date, age, height, weight = args
+                self.conn.execute("INSERT OR REPLACE INTO measurements VALUES (?, ?, ?, ?, ?)",
+                                  (user_id, date.toordinal(), age, height, weight))
+                self.conn.execute("UPDATE users SET age = ?, height = ?, weight = ? WHERE user_id = ?",
+                                  (age, height, weight, user_id))
+            elif op == 'rename':
+                self.conn.execute("UPDATE users SET first_name = ? WHERE user_id = ?", (args[0], user_id))
+
+        if op == 'register':
+            self.users[user_id] = UserInfo(*args)
+        elif op == 'measure':
+            # Якщо користувача не було в пам'яті, він завантажиться вже з новим заміром
+            user_info = self.users[user_id]
+            user_info.age, user_info.height, user_info.weight = args[1:]
+            user_info.measurements.upsert(*args)
+        elif op == 'rename':
+            self.users[user_id].first_name = args[0]
+
+    def measurements_since(self, date):
+        result = {}
+        rows = self.query("SELECT user_id, date, weight FROM measurements WHERE date >= ? ORDER BY user_id, date",
+                          (date.toordinal(),))
+        for user_id, date, weight in rows:
+            result.setdefault(user_id, []).append((date_type.fromordinal(date), weight))
+        return result
+
+    def profile_arrays(self):
+        rows = self.query("SELECT gender = '👨', age, height, weight FROM users")
+        table = np.array(rows, dtype=float).reshape(-1, 4)
+        return table[:, 0] == 1, table[:, 1], table[:, 2], table[:, 3]
+
+    def names_since(self, date):
+        rows = self.query("""SELECT user_id, first_name FROM users WHERE user_id IN
+                             (SELECT DISTINCT user_id FROM measurements WHERE date >= ?)""", (date.toordinal(),))
+        return dict(rows)
+
+    def close(self):
+        with self.read_lock:
+            self.reader.close()
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,308 @@
+import argparse
+import csv
+import os
+import pickle
+import sqlite3
+import sys
+from datetime import date as date_type
+import models
+from models import UserInfo
+from storage import PickleStorage, SQLiteStorage, DATA_FILE, JOURNAL_FILE, DB_FILE
+
+# Потоковий імпорт і експорт користувачів та замірів у колонковому форматі.
+# Дані передаються пакетами по CHUNK_SIZE рядків, тому пам'ять не залежить від обсягу бази
+# (крім pickle-сховища, яке за своєю природою читається і пишеться цілком).
+#   python transfer.py export --backend sqlite --output backup
+#   python transfer.py import --input backup --backend sqlite
+#   python transfer.py convert-legacy old_user_data.pickle --backend sqlite
+CHUNK_SIZE = 10000
+USER_COLUMNS = ('user_id', 'gender', 'first_name', 'age', 'height', 'weight')
+MEASUREMENT_COLUMNS = ('user_id', 'date', 'age', 'height', 'weight')
+
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# Старі файли даних зберігали класи з модуля __main__ (main.py, запущеного як скрипт)
+class LegacyUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        if module == '__main__' and hasattr(models, name):
+            return getattr(models, name)
+        return super().find_class(module, name)
+
+
+def load_legacy(path):
+    with open(path, 'rb') as file:
+        return LegacyUnpickler(file).load()
+
+
+# Джерела: кожне віддає пакети рядків користувачів і замірів окремо
+
+class MemorySource:
+    def __init__(self, users):
+        self.users = users
+
+    def users_chunks(self, size):
+        rows = ((user_id, user_info.gender, user_info.first_name, user_info.age, user_info.height, user_info.weight)
+                for user_id, user_info in self.users.items())
+        return chunked(rows, size)
+
+    def measurements_chunks(self, size):
+        rows = ((user_id, m['date'], m['age'], m['height'], m['weight'])
+                for user_id, user_info in self.users.items() for m in user_info.measurements)
+        return chunked(rows, size)
+
+
+# База відкривається лише на читання: експорт можна робити поруч із працюючим ботом
+class SQLiteSource:
+    def __init__(self, path):
+        self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+    def _chunks(self, sql, size, convert=None):
+        cursor = self.conn.execute(sql)
+        while rows := cursor.fetchmany(size):
+            yield [convert(row) for row in rows] if convert else rows
+
+    def users_chunks(self, size):
+        return self._chunks("SELECT user_id, gender, first_name, age, height, weight FROM users ORDER BY user_id", size)
+
+    def measurements_chunks(self, size):
+        return self._chunks("SELECT user_id, date, age, height, weight FROM measurements ORDER BY user_id, date", size,
+                            lambda row: (row[0], date_type.fromordinal(row[1])) + row[2:])
+
+
+class ParquetSource:
+    def __init__(self, directory):
+        import pyarrow.parquet
+        self.parquet = pyarrow.parquet
+        self.directory = directory
+
+    def _chunks(self, name, size):
+        parquet_file = self.parquet.ParquetFile(os.path.join(self.directory, f"{name}.parquet"))
+        for batch in parquet_file.iter_batches(batch_size=size):
+            columns = [column.to_pylist() for column in batch.columns]
+            yield list(zip(*columns))
+
+    def users_chunks(self, size):
+        return self._chunks('users', size)
+
+    def measurements_chunks(self, size):
+        return self._chunks('measurements', size)
+
+
+def _number(cast):
+    return lambda value: cast(value) if value != '' else None
+
+
+USER_CASTS = (int, _number(str), _number(str), _number(int), _number(float), _number(float))
+MEASUREMENT_CASTS = (int, date_type.fromisoformat, _number(int), _number(float), _number(float))
+
+
+class CSVSource:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _chunks(self, name, casts, size):
+        with open(os.path.join(self.directory, f"{name}.csv"), newline='', encoding='utf-8') as file:
+            reader = csv.reader(file)
+            next(reader)
+            rows = (tuple(cast(value) for cast, value in zip(casts, row)) for row in reader)
+            yield from chunked(rows, size)
+
+    def users_chunks(self, size):
+        return self._chunks('users', USER_CASTS, size)
+
+    def measurements_chunks(self, size):
+        return self._chunks('measurements', MEASUREMENT_CASTS, size)
+
+
+# Приймачі: пишуть пакети по мірі надходження
+
+class ParquetSink:
+    def __init__(self, directory):
+        import pyarrow
+        import pyarrow.parquet
+        self.pyarrow = pyarrow
+        self.parquet = pyarrow.parquet
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _write(self, name, schema, chunks):
+        with self.parquet.ParquetWriter(os.path.join(self.directory, f"{name}.parquet"), schema) as writer:
+            for chunk in chunks:
+                columns = list(zip(*chunk))
+                writer.write_table(self.pyarrow.Table.from_arrays(
+                    [self.pyarrow.array(column, type=field.type) for column, field in zip(columns, schema)],
+                    schema=schema))
+
+    def write_users(self, chunks):
+        pa = self.pyarrow
+        self._write('users', pa.schema([('user_id', pa.int64()), ('gender', pa.string()), ('first_name', pa.string()),
+                                        ('age', pa.int32()), ('height', pa.float64()), ('weight', pa.float64())]),
+                    chunks)
+
+    def write_measurements(self, chunks):
+        pa = self.pyarrow
+        self._write('measurements', pa.schema([('user_id', pa.int64()), ('date', pa.date32()), ('age', pa.int32()),
+                                               ('height', pa.float64()), ('weight', pa.float64())]),
+                    chunks)
+
+    def close(self):
+        pass
+
+
+class CSVSink:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _write(self, name, columns, chunks):
+        with open(os.path.join(self.directory, f"{name}.csv"), 'w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(columns)
+            for chunk in chunks:
+                writer.writerows(['' if value is None else value for value in row] for row in chunk)
+
+    def write_users(self, chunks):
+        self._write('users', USER_COLUMNS, chunks)
+
+    def write_measurements(self, chunks):
+        self._write('measurements', MEASUREMENT_COLUMNS, chunks)
+
+    def close(self):
+        pass
+
+
+# Імпорт у SQLite: кожен пакет - одна транзакція; існуючі записи з тими ж ключами замінюються
+class SQLiteSink:
+    def __init__(self, path):
+        SQLiteStorage(path, 1).close()  # створення схеми
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA synchronous=OFF")
+
+    def write_users(self, chunks):
+        for chunk in chunks:
+            with self.conn:
+                self.conn.executemany("INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?, ?, ?)", chunk)
+
+    def write_measurements(self, chunks):
+        for chunk in chunks:
+            with self.conn:
+                self.conn.executemany("INSERT OR REPLACE INTO measurements VALUES (?, ?, ?, ?, ?)",
+                                      [(user_id, date.toordinal(), age, height, weight)
+                                       for user_id, date, age, height, weight in chunk])
+
+    def close(self):
+        self.conn.close()
+
+
+# Імпорт у pickle-сховище: знімок пишеться цілком у кінці
+class PickleSink:
+    def __init__(self, data_file, journal_file):
+        if os.path.exists(data_file) or os.path.exists(journal_file):
+            raise SystemExit(f"{data_file} або {journal_file} вже існує; імпорт у pickle-сховище лише в порожнє")
+        self.data_file = data_file
+        self.users = {}
+        self.skipped = 0
+
+    def write_users(self, chunks):
+        for chunk in chunks:
+            for user_id, gender, first_name, age, height, weight in chunk:
+                self.users[user_id] = UserInfo(gender, first_name, age, height, weight)
+
+    def write_measurements(self, chunks):
+        for chunk in chunks:
+            for user_id, date, age, height, weight in chunk:
+                user_info = self.users.get(user_id)
+                if user_info is None:
+                    self.skipped += 1
+                    continue
+                user_info.measurements.upsert(date, age, height, weight)
+
+    def close(self):
+        if self.skipped:
+            print(f"Пропущено {self.skipped} замірів користувачів, яких немає в даних", file=sys.stderr)
+        tmp_file = self.data_file + '.tmp'
+        with open(tmp_file, 'wb') as file:
+            pickle.dump(self.users, file)
+        os.replace(tmp_file, self.data_file)
+
+
+def default_format():
+    try:
+        import pyarrow.parquet  # noqa: F401
+        return 'parquet'
+    except ImportError:
+        return 'csv'
+
+
+# pickle-сховище читається без змін файлів, тому бот може працювати під час експорту
+def open_backend_source(backend):
+    if backend == 'sqlite':
+        return SQLiteSource(DB_FILE)
+    return MemorySource(PickleStorage(DATA_FILE, JOURNAL_FILE).read())
+
+
+def open_backend_sink(backend):
+    if backend == 'sqlite':
+        return SQLiteSink(DB_FILE)
+    return PickleSink(DATA_FILE, JOURNAL_FILE)
+
+
+def transfer(source, sink, chunk_size):
+    sink.write_users(source.users_chunks(chunk_size))
+    sink.write_measurements(source.measurements_chunks(chunk_size))
+    sink.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Імпорт і експорт даних користувачів")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export = commands.add_parser('export', help="вивантажити дані сховища в каталог")
+    export.add_argument('--backend', choices=('pickle', 'sqlite'), required=True)
+    export.add_argument('--output', required=True)
+    export.add_argument('--format', choices=('parquet', 'csv'))
+
+    load = commands.add_parser('import', help="завантажити дані з каталогу в сховище")
+    load.add_argument('--input', required=True)
+    load.add_argument('--backend', choices=('pickle', 'sqlite'), required=True)
+
+    convert = commands.add_parser('convert-legacy', help="перенести старий user_data.pickle у сховище або каталог")
+    convert.add_argument('path')
+    target = convert.add_mutually_exclusive_group(required=True)
+    target.add_argument('--backend', choices=('pickle', 'sqlite'))
+    target.add_argument('--output')
+    convert.add_argument('--format', choices=('parquet', 'csv'))
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        source = open_backend_source(args.backend)
+    elif args.command == 'import':
+        if os.path.exists(os.path.join(args.input, 'users.parquet')):
+            source = ParquetSource(args.input)
+        else:
+            source = CSVSource(args.input)
+    else:
+        source = MemorySource(load_legacy(args.path))
+
+    if getattr(args, 'output', None):
+        sink = ParquetSink(args.output) if (args.format or default_format()) == 'parquet' else CSVSink(args.output)
+    else:
+        sink = open_backend_sink(args.backend)
+
+    transfer(source, sink, args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Модулі бота імпортуються як скрипти з каталогу slim_tracker
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'slim_tracker'))
+
+# service читає налаштування під час імпорту
+os.environ.setdefault('TG_CHAT_ADMIN', '1')
+os.environ.setdefault('TG_BOT_TOKEN', '0:test')
@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+import pytest
+import service
+from conversation import (conversations, conversation_state, has_conversation, run_step, begin_registration,
+                          begin_measurements)
+
+USER_ID = 7
+
+
+def message(text):
+    return SimpleNamespace(text=text, from_user=SimpleNamespace(id=USER_ID, first_name='Оля'))
+
+
+def answer(text):
+    texts, _ = run_step(message(text))
+    return texts
+
+
+@pytest.fixture(autouse=True)
+def bot_data(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(service, 'STORAGE_BACKEND', 'pickle')
+    service.user_data.users.clear()
+    service.load_data()
+    conversations.delete(USER_ID)
+    yield
+    service.close_data()
+
+
+def test_registration():
+    texts, _ = begin_registration(message('/start'))
+    assert len(texts) == 2
+    for text in ('👩', '28', '165'):
+        answer(text)
+    assert answer('60.5')[-1] == "Головне меню:"
+
+    user_info = service.user_data[USER_ID]
+    assert (user_info.gender, user_info.first_name, user_info.age, user_info.height, user_info.weight) == \
+        ('👩', 'Оля', 28, 165.0, 60.5)
+    assert len(user_info.measurements) == 1
+    assert not has_conversation(message('Мій профіль 👤'))
+
+
+def test_invalid_input_repeats_step():
+    begin_registration(message('/start'))
+    answer('👩')
+    assert answer('двадцять') == ["Будь ласка, введи вік в числовому форматі!"]
+    assert conversation_state(message('28'))[0] == 'age'
+    answer('28')
+    assert conversation_state(message('165'))[0] == 'height'
+
+
+def test_measurements_keep_values_on_next():
+    service.save_data('register', USER_ID, '👩', 'Оля', 28, 165.0, 60.5)
+    begin_measurements(message('Внести заміри 📏'))
+    answer('Далі')
+    answer('166')
+    assert answer('59') == ["Дані збережені!", "Головне меню:"]
+
+    user_info = service.user_data[USER_ID]
+    assert (user_info.age, user_info.height, user_info.weight) == (28, 166.0, 59.0)
+    assert not has_conversation(message('Мій профіль 👤'))
+
+
+def test_state_is_read_once_per_message(monkeypatch):
+    begin_registration(message('/start'))
+    reads = []
+    get = conversations.get
+    monkeypatch.setattr(conversations, 'get', lambda user_id: reads.append(user_id) or get(user_id))
+
+    step = message('👩')
+    assert has_conversation(step)
+    run_step(step)
+    assert reads == [USER_ID]
@@ -0,0 +1,47 @@
+import threading
+import time
+from types import SimpleNamespace
+from telebot import types
+from dispatcher import ShardedTeleBot, update_user_id
+
+
+def update(update_id, user_id):
+    return types.Update.de_json({'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 0, 'text': str(update_id),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'Тест'}}})
+
+
+def test_update_user_id():
+    assert update_user_id(update(1, 42)) == 42
+    assert update_user_id(SimpleNamespace(update_id=5, message=None, edited_message=None, callback_query=None)) == 5
+
+
+def test_polling_handles_each_update_once():
+    bot = ShardedTeleBot('0:test', workers=2)
+    pending = [update(update_id, update_id % 3) for update_id in range(1, 11)]
+    offsets = []
+    handled = []
+    lock = threading.Lock()
+
+    # Фальшивий getUpdates: як і Telegram, віддає все, що не підтверджене offset
+    def get_updates(offset=None, **kwargs):
+        offsets.append(offset)
+        if len(offsets) == 5:
+            bot.stop_polling()
+        time.sleep(0.05)
+        return [item for item in pending if item.update_id >= offset]
+
+    @bot.message_handler(func=lambda message: True)
+    def handle(message):
+        time.sleep(0.2)  # повільний обробник (розпізнавання голосу)
+        with lock:
+            handled.append(message.message_id)
+
+    bot.get_updates = get_updates
+    bot.get_me = lambda: types.User(1, True, 'Бот', username='slim_tracker_bot')
+    bot.polling(non_stop=True, interval=0)
+    bot.join()
+
+    assert sorted(handled) == list(range(1, 11))
+    assert offsets[:2] == [1, 11]
@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+from leaderboard import Leaderboard, WINDOW_DAYS
+from models import kiev_timezone
+
+
+def days_ago(days):
+    return datetime.now(kiev_timezone).date() - timedelta(days=days)
+
+
+def test_ranking_orders_by_relative_change():
+    board = Leaderboard()
+    board.build({1: 'А', 2: 'Б', 3: 'В', 4: 'Г'}, {
+        1: [(days_ago(2), 100.0), (days_ago(0), 95.0)],
+        2: [(days_ago(3), 80.0), (days_ago(1), 80.0)],
+        3: [(days_ago(1), 50.0), (days_ago(0), 51.0)],
+        4: [(days_ago(1), 70.0)],  # один замір - ще немає зміни
+    })
+
+    assert board.top() == [
+        ('А', Decimal('-5'), "зменшення ваги на"),
+        ('Б', Decimal('0'), "без змін"),
+        ('В', Decimal('2'), "збільшення ваги на"),
+    ]
+    assert len(board.top(limit=1)) == 1
+
+
+def test_apply_updates_ranking_and_names():
+    board = Leaderboard()
+    board.build({}, {})
+    board.apply(('measure', 1, days_ago(1), 30, 180.0, 90.0), 'А')
+    assert board.top() == []
+
+    version = board.version
+    board.apply(('measure', 1, days_ago(0), 30, 180.0, 81.0), 'А')
+    board.apply(('rename', 1, 'Аня'), 'Аня')
+    assert board.top() == [('Аня', Decimal('-10'), "зменшення ваги на")]
+    assert board.version > version
+
+    # Заміри, старші за вікно, в таблицю не потрапляють
+    board.apply(('measure', 2, days_ago(WINDOW_DAYS + 1), 30, 180.0, 90.0), 'Б')
+    assert 2 not in board.names
+
+
+def test_rollover_drops_expired_measurements():
+    board = Leaderboard()
+    board.build({1: 'А', 2: 'Б'}, {
+        1: [(days_ago(WINDOW_DAYS + 1), 100.0), (days_ago(3), 95.0), (days_ago(1), 90.0)],
+        2: [(days_ago(WINDOW_DAYS + 2), 70.0), (days_ago(WINDOW_DAYS + 1), 71.0)],
+    })
+    assert len(board.top()) == 2
+
+    # Наступний день: таблиця побудована вчора
+    board.day = days_ago(1)
+    board.rollover()
+
+    [(name, change, _)] = board.top()
+    assert name == 'А'
+    assert change == (Decimal('90.0') - Decimal('95.0')) / Decimal('95.0') * 100
+    assert board.names == {1: 'А'}
+    assert 2 not in board.windows
+
+
+def test_version_changes_only_with_shown_places():
+    board = Leaderboard(limit=2)
+    board.build({1: 'А', 2: 'Б', 3: 'В'}, {
+        1: [(days_ago(2), 100.0), (days_ago(1), 90.0)],
+        2: [(days_ago(2), 100.0), (days_ago(1), 95.0)],
+        3: [(days_ago(2), 100.0), (days_ago(1), 99.0)],
+    })
+    assert [name for name, _, _ in board.top()] == ['А', 'Б']
+    version = board.version
+
+    # Зміни за межами показаних місць і реєстрація не скидають готовий текст таблиці
+    board.apply(('measure', 3, days_ago(0), 30, 180.0, 98.0), 'В')
+    board.apply(('rename', 3, 'Віра'), 'Віра')
+    board.apply(('register', 4, '👩', 'Г', 30, 165.0, 60.0), 'Г')
+    assert board.version == version
+
+    board.apply(('rename', 2, 'Богдан'), 'Богдан')
+    assert board.version == version + 1
+    board.apply(('measure', 3, days_ago(0), 30, 180.0, 80.0), 'Віра')
+    assert board.version == version + 2
+    assert [name for name, _, _ in board.top()] == ['Віра', 'А']
+
+    board.build(dict(board.names), {user_id: list(window.items()) for user_id, window in board.windows.items()})
+    assert board.version == version + 2
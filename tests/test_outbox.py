@@ -0,0 +1,108 @@
+import time
+from collections import deque
+from types import SimpleNamespace
+import pytest
+import outbox
+from outbox import MAX_MESSAGE_LENGTH, MAX_RETRIES, Outbox, coalesce, retry_after
+
+
+def text(value, markup=None):
+    return ('send_message', (value,), {'reply_markup': markup})
+
+
+def test_coalesce_joins_consecutive_texts():
+    pending = deque([text('а'), text('б'), text('в', markup='клавіатура'), text('г')])
+    assert coalesce(pending) == ('send_message', ('а\n\nб\n\nв',), {'reply_markup': 'клавіатура'})
+    assert list(pending) == [text('г')]
+
+
+def test_coalesce_respects_length_limit():
+    long = 'x' * (MAX_MESSAGE_LENGTH - 10)
+    pending = deque([text(long), text('y' * 20)])
+    assert coalesce(pending)[1] == (long,)
+    assert len(pending) == 1
+
+
+def test_coalesce_keeps_voice_separate():
+    voice = ('send_voice', ('file',), {'caption': None})
+    pending = deque([text('а'), voice, text('б')])
+    assert coalesce(pending)[1] == ('а',)
+    assert coalesce(pending) == voice
+    assert coalesce(pending)[1] == ('б',)
+
+
+class TelegramError(Exception):
+    def __init__(self, error_code, parameters=None):
+        super().__init__(error_code)
+        self.error_code = error_code
+        self.result_json = {'parameters': parameters or {}}
+
+
+class FakeBot:
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.sent = []
+
+    def send_message(self, chat_id, text, reply_markup=None):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append((chat_id, text))
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    waits = []
+    monkeypatch.setattr(outbox, 'time', SimpleNamespace(sleep=waits.append, monotonic=time.monotonic))
+    return waits
+
+
+def deliver(bot):
+    Outbox(bot, workers=0)._deliver(5, *text('привіт'))
+
+
+def test_retry_after():
+    assert retry_after(TelegramError(429, {'retry_after': 7})) == 7
+    assert retry_after(TelegramError(400)) is None
+    assert retry_after(ConnectionError()) is None
+
+
+def test_rate_limited_message_is_retried_after_delay(sleeps):
+    bot = FakeBot([TelegramError(429, {'retry_after': 3})])
+    deliver(bot)
+    assert bot.sent == [(5, 'привіт')]
+    assert 3 in sleeps
+
+
+def test_rejected_message_is_not_retried(sleeps):
+    bot = FakeBot([TelegramError(400), TelegramError(400)])
+    deliver(bot)
+    assert bot.sent == []
+    assert len(bot.errors) == 1
+
+
+def test_network_error_is_retried_with_backoff(sleeps):
+    bot = FakeBot([ConnectionError(), ConnectionError()])
+    deliver(bot)
+    assert bot.sent == [(5, 'привіт')]
+    assert [wait for wait in sleeps if wait] == [1, 2]
+
+
+def test_gives_up_after_max_retries(sleeps):
+    bot = FakeBot([ConnectionError()] * (MAX_RETRIES + 2))
+    deliver(bot)
+    assert bot.sent == []
+    assert len(bot.errors) == 1
+
+
+def test_messages_of_one_chat_are_sent_in_order():
+    bot = FakeBot()
+    queue = Outbox(bot, workers=2)
+    queue.send_message(5, 'перше', reply_markup='клавіатура')
+    queue.send_message(5, 'друге')
+    queue.send_message(6, 'інше')
+    deadline = time.monotonic() + 5
+    while (queue.depth() or queue.chats) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # Повідомлення з клавіатурою не склеюється з наступним
+    assert [text for chat_id, text in bot.sent if chat_id == 5] == ['перше', 'друге']
+    assert (6, 'інше') in bot.sent
@@ -0,0 +1,70 @@
+import random
+from datetime import datetime, timedelta
+from models import UserInfo, kiev_timezone
+from rollups import RollupStore, compute_rollup, stats_from_rollup
+
+
+def today():
+    return datetime.now(kiev_timezone).date()
+
+
+def random_user(rng):
+    user_info = UserInfo('👨', 'Іван', 30, 180.0, 80.0)
+    last = rng.choice([0, 0, 1, 2, 40])  # днів від останнього заміру до сьогодні
+    for days_ago in range(rng.randint(0, 150) + last, last - 1, -1):
+        if rng.random() < 0.6:
+            user_info.measurements.upsert(today() - timedelta(days=days_ago), 30, 180.0, round(rng.uniform(60, 100), 1))
+    return user_info
+
+
+def difference_text(difference, days):
+    return f"{difference:.2f} кг" if difference is not None else f"Немає достатньо даних за останні {days} днів."
+
+
+# Підсумки дають ті самі значення, що й методи UserInfo, які проходять увесь ряд
+def test_rollup_stats_match_full_series_methods():
+    rng = random.Random(16)
+    for _ in range(300):
+        user_info = random_user(rng)
+        stats = stats_from_rollup(compute_rollup(user_info, today()), user_info.measurements)
+
+        assert difference_text(stats.differences[7], 7) == user_info.get_weekly_weight_difference()
+        assert difference_text(stats.differences[30], 30) == user_info.get_monthly_weight_difference()
+        if stats.last_difference is not None:
+            assert f"{stats.last_difference:.2f} кг" == user_info.get_weight_difference()
+        else:
+            assert user_info.get_weight_difference() == "Немає достатньо даних для обчислення різниці."
+
+        last_measurements = user_info.get_last_measurements()
+        assert (stats.today_weight is not None) == last_measurements.startswith("Сьогодні: Вага")
+        assert (stats.yesterday_weight is not None) == ("Вчора: Вага" in last_measurements)
+        if stats.today_weight is not None:
+            assert f"Сьогодні: Вага {stats.today_weight} кг" in last_measurements
+        if stats.yesterday_weight is not None:
+            assert f"Вчора: Вага {stats.yesterday_weight} кг" in last_measurements
+
+
+def test_today_measurement_keeps_rollup_and_past_one_drops_it():
+    store = RollupStore()
+    user_info = UserInfo('👨', 'Іван', 30, 180.0, 80.0)
+    user_info.measurements.upsert(today() - timedelta(days=1), 30, 180.0, 80.0)
+    rollup = store.get(1, user_info)
+
+    store.apply(('measure', 1, today(), 30, 180.0, 79.0))
+    user_info.measurements.upsert(today(), 30, 180.0, 79.0)
+    assert store.get(1, user_info) is rollup
+    assert store.stats(1, user_info).differences[7] == -1.0
+
+    store.apply(('measure', 1, today() - timedelta(days=2), 30, 180.0, 81.0))
+    assert 1 not in store.rollups
+
+
+def test_refresh_recomputes_only_users_with_rollups():
+    store = RollupStore()
+    users = {user_id: UserInfo('👨', 'Іван', 30, 180.0, 80.0) for user_id in (1, 2)}
+    yesterday = today() - timedelta(days=1)
+    store.get(1, users[1], yesterday)
+
+    store.refresh(users.items(), today())
+    assert set(store.rollups) == {1}
+    assert store.rollups[1].day == today()
@@ -0,0 +1,42 @@
+from datetime import datetime
+import pytest
+import service
+from models import kiev_timezone
+
+
+@pytest.fixture(params=['pickle', 'sqlite'])
+def bot_data(request, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(service, 'STORAGE_BACKEND', request.param)
+    service.user_data.users.clear()
+    service.load_data()
+    yield
+    service.close_data()
+
+
+def measure(user_id, weight):
+    service.save_data('measure', user_id, datetime.now(kiev_timezone).date(), 30, 180.0, weight)
+
+
+# Перебудова таблиці читає сховище без data_lock; збережене тим часом не губиться
+def test_leaderboard_rebuild_keeps_concurrent_changes(bot_data, monkeypatch):
+    service.save_data('register', 1, '👨', 'Іван', 30, 180.0, 80.0)
+    service.save_data('register', 2, '👩', 'Оля', 30, 165.0, 60.0)
+    yesterday = datetime.now(kiev_timezone).date().toordinal() - 1
+    service.save_data('measure', 1, datetime.fromordinal(yesterday).date(), 30, 180.0, 80.0)
+    service.save_data('measure', 2, datetime.fromordinal(yesterday).date(), 30, 165.0, 60.0)
+
+    measurements_since = service.storage.measurements_since
+
+    def scan(date):
+        assert not service.data_lock.locked()
+        result = measurements_since(date)
+        measure(2, 54.0)
+        return result
+
+    monkeypatch.setattr(service.storage, 'measurements_since', scan)
+    measure(1, 76.0)
+    service.build_leaderboard()
+
+    assert [name for name, _, _ in service.leaderboard.top()] == ['Оля', 'Іван']
+    assert service.leaderboard_changes is None
@@ -0,0 +1,70 @@
+import random
+from collections import Counter
+import numpy as np
+from models import UserInfo
+from stats import BMI_STATUSES, CHILD_STATUS, HISTOGRAM_EDGES, population_stats
+
+# Проміжки між межами в get_health_status (наприклад, 24.9 <= ІМТ < 25.0), куди старий метод
+# не відносить жодного статусу, крім останнього
+STATUS_GAPS = (24.9, 29.9, 34.9, 39.9)
+
+
+def arrays(users):
+    return (np.array([user_info.gender == '👨' for user_info in users], dtype=bool),
+            *np.array([[np.nan if value is None else value for value in (user_info.age, user_info.height, user_info.weight)]
+                       for user_info in users], dtype=float).reshape(-1, 3).T)
+
+
+def random_adults(rng, count):
+    users = []
+    while len(users) < count:
+        user_info = UserInfo(rng.choice(['👨', '👩']), 'Тест', rng.randint(18, 90),
+                             round(rng.uniform(150, 200), 1), round(rng.uniform(40, 160), 1))
+        bmi = user_info.calculate_bmi()
+        low, high = user_info.get_optimal_weight()
+        # Старий метод округлює межі оптимальної ваги, тому значення біля них не порівнюються
+        if any(gap <= bmi < gap + 0.1 for gap in STATUS_GAPS) or min(abs(user_info.weight - low),
+                                                                         abs(user_info.weight - high)) < 0.1:
+            continue
+        users.append(user_info)
+    return users
+
+
+def test_population_stats_match_health_status():
+    users = random_adults(random.Random(20), 500)
+    stats = population_stats(*arrays(users))
+
+    expected = Counter(user_info.get_health_status().split(", ")[0] for user_info in users)
+    assert stats.users == len(users)
+    assert stats.statuses == {**{status: expected[status] for status in BMI_STATUSES}, CHILD_STATUS: 0}
+
+    optimal = [user_info.get_optimal_weight() for user_info in users]
+    above = [user_info.weight - high for user_info, (low, high) in zip(users, optimal) if user_info.weight > high]
+    assert stats.above_optimal_range == len(above)
+    assert stats.in_optimal_range == sum(low <= user_info.weight <= high
+                                         for user_info, (low, high) in zip(users, optimal))
+    assert abs(stats.mean_excess_weight - sum(above) / len(above)) < 0.1
+
+    bmi = [user_info.calculate_bmi() for user_info in users]
+    assert stats.mean_bmi == round(float(np.mean(bmi)), 2)
+    assert stats.median_bmi == round(float(np.median(bmi)), 2)
+
+
+def test_histogram_and_children():
+    users = random_adults(random.Random(21), 200)
+    users += [UserInfo('👩', 'Дитина', 10, 140.0, 35.0), UserInfo('👨', 'Підліток', 15, 170.0, 60.0)]
+    # Без віку чи зросту користувач у статистику не потрапляє
+    users += [UserInfo('👨', 'Без віку', None, 180.0, 80.0), UserInfo('👨', 'Без зросту', 30, None, 80.0)]
+    stats = population_stats(*arrays(users))
+
+    assert stats.users == 202
+    assert stats.statuses[CHILD_STATUS] == 2
+    assert sum(count for _, _, count in stats.histogram) == 202
+    assert len(stats.histogram) == len(HISTOGRAM_EDGES) + 1
+    for low, high, count in stats.histogram:
+        assert count == sum((low is None or user_info.calculate_bmi() >= low) and
+                            (high is None or user_info.calculate_bmi() < high) for user_info in users[:202])
+
+
+def test_no_valid_users():
+    assert population_stats(*arrays([UserInfo('👨', 'Без віку', None, 180.0, 80.0)])) is None
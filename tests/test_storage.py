@@ -0,0 +1,230 @@
+import pickle
+import threading
+from datetime import date
+import pytest
+from models import UserInfo
+from storage import PickleStorage, SQLiteStorage, UserRepository
+
+REGISTER = ('register', 1, '👨', 'Іван', 30, 180.0, 80.0)
+MEASURE = ('measure', 1, date(2026, 1, 1), 30, 180.0, 79.5)
+
+
+def write_records(path, records, tail=b''):
+    with open(path, 'wb') as file:
+        for record in records:
+            pickle.dump(record, file)
+        file.write(tail)
+
+
+def files(directory):
+    return {path.name: path.read_bytes() for path in directory.iterdir()}
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return tmp_path / 'data.pickle', tmp_path / 'data.journal', tmp_path / 'data.journal.old'
+
+
+def open_storage(paths):
+    storage = PickleStorage(str(paths[0]), str(paths[1]))
+    users = UserRepository()
+    storage.load(users)
+    return storage, users
+
+
+def test_journal_replay_restores_records(paths):
+    storage, _ = open_storage(paths)
+    storage.append(REGISTER)
+    storage.append(MEASURE)
+    storage.close()
+
+    storage, users = open_storage(paths)
+    assert users[1].weight == 79.5
+    assert users[1].measurements.get(date(2026, 1, 1))['weight'] == 79.5
+    storage.close()
+
+
+def test_torn_tail_is_truncated_on_load(paths):
+    write_records(paths[1], [REGISTER], tail=pickle.dumps(('rename', 1, 'Петро'))[:-3])
+    good_size = len(pickle.dumps(REGISTER))
+
+    storage, users = open_storage(paths)
+    assert users[1].first_name == 'Іван'
+    assert paths[1].stat().st_size == good_size
+    storage.append(('rename', 1, 'Петро'))
+    storage.close()
+
+    storage, users = open_storage(paths)
+    assert users[1].first_name == 'Петро'
+    storage.close()
+
+
+def test_interrupted_compaction_is_finished_on_load(paths):
+    write_records(paths[2], [REGISTER])
+    write_records(paths[1], [MEASURE])
+
+    storage, users = open_storage(paths)
+    storage.close()
+    assert users[1].weight == 79.5
+    assert not paths[2].exists()
+    with open(paths[0], 'rb') as file:
+        assert pickle.load(file)[1].weight == 79.5
+
+
+def test_compaction_writes_snapshot(paths):
+    storage, _ = open_storage(paths)
+    storage.append(REGISTER)
+    storage.journal._compact()
+    storage.append(MEASURE)
+    storage.close()
+
+    assert not paths[2].exists()
+    assert storage.journal.snapshot_size == paths[0].stat().st_size
+    with open(paths[0], 'rb') as file:
+        assert pickle.load(file)[1].weight == 80.0
+    storage, users = open_storage(paths)
+    assert users[1].weight == 79.5
+    storage.close()
+
+
+def test_failed_snapshot_keeps_old_journal(paths, monkeypatch):
+    storage, _ = open_storage(paths)
+
+    def fail():
+        raise OSError("disk full")
+
+    monkeypatch.setattr(storage.journal, '_write_snapshot', fail)
+    storage.append(REGISTER)
+    storage.journal._compact()
+    storage.append(MEASURE)
+    # .old ще не увійшов у знімок, тому друга спроба не повинна його перезаписати
+    storage.journal._compact()
+    storage.close()
+
+    storage, users = open_storage(paths)
+    assert users[1].weight == 79.5
+    storage.close()
+
+
+def test_compaction_waits_for_part_of_snapshot_size(paths, monkeypatch):
+    storage, _ = open_storage(paths)
+    started = threading.Event()
+    monkeypatch.setattr(storage.journal, '_compact', started.set)
+    storage.journal.compact_bytes = 0
+    storage.journal.snapshot_size = 40 * len(pickle.dumps(MEASURE))
+
+    storage.append(REGISTER)
+    while storage.journal.file.tell() < storage.journal.snapshot_size * storage.journal.compact_ratio:
+        assert not started.is_set()
+        storage.append(MEASURE)
+    assert started.wait(5)
+    storage.close()
+
+
+def test_snapshot_is_serialized_outside_data_lock(paths, monkeypatch):
+    lock = threading.Lock()
+    storage = PickleStorage(str(paths[0]), str(paths[1]), lock)
+    storage.load(UserRepository())
+    storage.append(REGISTER)
+    storage.append(MEASURE)
+
+    dump = pickle.dump
+    dumped = []
+
+    def checked_dump(users, file):
+        assert not lock.locked()
+        dumped.append(users)
+        dump(users, file)
+
+    monkeypatch.setattr(pickle, 'dump', checked_dump)
+    storage.journal._compact()
+    monkeypatch.undo()
+    storage.close()
+
+    # У знімок пішли копії: подальші зміни обробників їх не зачіпають
+    [users] = dumped
+    assert users[1] is not storage.users[1]
+    assert users[1].measurements.days is not storage.users[1].measurements.days
+    assert users[1].measurements.get(date(2026, 1, 1))['weight'] == 79.5
+
+
+@pytest.fixture
+def loads():
+    return []
+
+
+@pytest.fixture
+def repository(loads):
+    stored = {user_id: UserInfo('👨', f"Користувач {user_id}", 30, 180.0, 80.0) for user_id in (1, 2, 3)}
+    users = UserRepository()
+    users.configure(2, lambda user_id: loads.append(user_id) or stored.get(user_id))
+    return users
+
+
+def test_repository_loads_lazily_and_evicts_least_recent(repository, loads):
+    assert repository[1].first_name == "Користувач 1"
+    assert repository[2].first_name == "Користувач 2"
+    repository.get(1)
+    repository.get(3)
+    assert loads == [1, 2, 3]
+    assert [user_id for user_id, _ in repository.items()] == [1, 3]
+
+    # Витіснений користувач підвантажується знову, а той, що в пам'яті, - ні
+    repository.get(2)
+    repository.get(2)
+    assert loads == [1, 2, 3, 2]
+    assert len(repository) == 2
+
+
+def test_repository_remembers_missing_users(repository, loads):
+    assert 9 not in repository
+    assert repository.get(9) is None
+    assert loads == [9]
+
+    # Реєстрація скидає позначку: після витіснення користувач знову шукається у сховищі
+    repository[9] = UserInfo('👩', 'Оля', 28, 165.0, 60.0)
+    assert repository[9].first_name == 'Оля'
+    repository.get(1)
+    repository.get(2)
+    assert 9 not in repository.users
+    repository.get(9)
+    assert loads == [9, 1, 2, 9]
+
+
+def test_read_does_not_modify_files(paths, tmp_path):
+    write_records(paths[2], [REGISTER])
+    write_records(paths[1], [MEASURE], tail=b'\x80\x04broken')
+    before = files(tmp_path)
+
+    users = PickleStorage(str(paths[0]), str(paths[1])).read()
+    assert users[1].weight == 79.5
+    assert files(tmp_path) == before
+
+
+def test_profile_arrays_follow_appends(paths):
+    storage, _ = open_storage(paths)
+    storage.append(REGISTER)
+    storage.append(('register', 2, '👩', 'Оля', None, 165.0, 60.0))
+    storage.append(MEASURE)
+    male, ages, heights, weights = storage.profile_arrays()
+    storage.close()
+
+    assert male.tolist() == [True, False]
+    assert ages[0] == 30 and ages[1] != ages[1]
+    assert heights.tolist() == [180.0, 165.0]
+    assert weights.tolist() == [79.5, 60.0]
+
+
+# Таблиця users оновлюється разом із заміром, тому інший процес бачить поточний профіль
+def test_sqlite_profile_is_current_for_other_connections(tmp_path):
+    writer = SQLiteStorage(str(tmp_path / 'data.sqlite3'), 10)
+    writer.load(UserRepository())
+    writer.append(REGISTER)
+    writer.append(MEASURE)
+
+    reader = SQLiteStorage(str(tmp_path / 'data.sqlite3'), 10)
+    reader.load(UserRepository())
+    male, ages, heights, weights = reader.profile_arrays()
+    assert (male.tolist(), ages.tolist(), heights.tolist(), weights.tolist()) == ([True], [30], [180.0], [79.5])
+    reader.close()
+    writer.close()
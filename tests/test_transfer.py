@@ -0,0 +1,84 @@
+import csv
+import pickle
+import sys
+from datetime import date, timedelta
+import pytest
+import transfer
+from storage import PickleStorage, SQLiteStorage, DATA_FILE, JOURNAL_FILE, DB_FILE
+
+
+# Формат старих файлів: клас UserInfo з модуля __main__ і заміри списком словників
+class LegacyUserInfo:
+    def __init__(self, gender, first_name, age, height, weight):
+        self.gender = gender
+        self.first_name = first_name
+        self.age = age
+        self.height = height
+        self.weight = weight
+        self.measurements = []
+
+
+LegacyUserInfo.__module__ = '__main__'
+LegacyUserInfo.__qualname__ = 'UserInfo'
+
+
+@pytest.fixture
+def legacy_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sys.modules['__main__'], 'UserInfo', LegacyUserInfo, raising=False)
+    users = {}
+    for user_id in range(1, 6):
+        user_info = LegacyUserInfo('👨' if user_id % 2 else '👩', f"Користувач {user_id}", 20 + user_id, 170.0, 80.0)
+        for day in range(10):
+            user_info.measurements.append({'date': date(2026, 1, 1) + timedelta(days=day), 'age': user_info.age,
+                                           'height': None if day == 0 else 170.0, 'weight': 80.0 - day / 10})
+        users[user_id] = user_info
+    with open('legacy.pickle', 'wb') as file:
+        pickle.dump(users, file)
+    return 'legacy.pickle'
+
+
+def read_rows(path):
+    with open(path, newline='', encoding='utf-8') as file:
+        return sorted(csv.reader(file))
+
+
+def assert_same_export(first, second):
+    for name in ('users.csv', 'measurements.csv'):
+        assert read_rows(f"{first}/{name}") == read_rows(f"{second}/{name}")
+
+
+def test_round_trip_through_both_backends(legacy_file):
+    transfer.main(['--chunk-size', '7', 'convert-legacy', legacy_file, '--output', 'legacy', '--format', 'csv'])
+    transfer.main(['--chunk-size', '7', 'import', '--input', 'legacy', '--backend', 'sqlite'])
+    transfer.main(['--chunk-size', '7', 'export', '--backend', 'sqlite', '--output', 'from_sqlite', '--format', 'csv'])
+    transfer.main(['--chunk-size', '7', 'import', '--input', 'from_sqlite', '--backend', 'pickle'])
+    transfer.main(['--chunk-size', '7', 'export', '--backend', 'pickle', '--output', 'from_pickle', '--format', 'csv'])
+
+    assert_same_export('legacy', 'from_sqlite')
+    assert_same_export('legacy', 'from_pickle')
+    assert len(read_rows('legacy/measurements.csv')) == 5 * 10 + 1
+
+    users = PickleStorage(DATA_FILE, JOURNAL_FILE).read()
+    assert users[2].first_name == "Користувач 2"
+    assert users[2].measurements.get(date(2026, 1, 1))['height'] is None
+    assert users[2].measurements.get(date(2026, 1, 10))['weight'] == 79.1
+
+    storage = SQLiteStorage(DB_FILE, 10)
+    assert storage.load_user(3).measurements.get(date(2026, 1, 5))['weight'] == 79.6
+    storage.close()
+
+
+def test_parquet_round_trip(legacy_file):
+    pytest.importorskip('pyarrow')
+    transfer.main(['convert-legacy', legacy_file, '--output', 'legacy', '--format', 'csv'])
+    transfer.main(['convert-legacy', legacy_file, '--output', 'parquet', '--format', 'parquet'])
+    transfer.main(['import', '--input', 'parquet', '--backend', 'sqlite'])
+    transfer.main(['export', '--backend', 'sqlite', '--output', 'from_sqlite', '--format', 'csv'])
+    assert_same_export('legacy', 'from_sqlite')
+
+
+def test_import_into_existing_pickle_store_is_refused(legacy_file):
+    transfer.main(['convert-legacy', legacy_file, '--backend', 'pickle'])
+    with pytest.raises(SystemExit):
+        transfer.main(['convert-legacy', legacy_file, '--backend', 'pickle'])